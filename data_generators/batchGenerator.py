@@ -0,0 +1,151 @@
+import multiprocessing as mp
+import numpy as np
+from otherScripts.checkingFunctions import isFeasibleGeneratorOk
+from otherScripts.nurseSchedule import NurseSchedule, matrixToMasks
+
+
+def getRng(seed, idxInstance):
+    """
+    Gets the random generator of an instance of a batch. It only depends on the seed of the batch and the index of the
+    instance, so an instance can be reproduced without generating the previous ones
+    :param seed: Seed of the batch
+    :param idxInstance: Index of the instance in the batch
+    :return: A numpy random generator
+    """
+    return np.random.default_rng([seed, idxInstance])
+
+
+def drawParams(rng, hoursDay, distr):
+    """
+    Draws the constraints and the demand of an instance
+    :param rng: Random generator of the instance
+    :param hoursDay: Number of hours in a day
+    :param distr: Dictionary with the (mean, standard deviation) of maxHours, maxConsec and maxPresence and the (mean at
+    the first hour, increase of the mean until the last hour, standard deviation) of the demand
+    :return: maxHours, maxConsec, maxPresence and the demand. The constraints are at least 1 and the demand at least 0
+    """
+    (maxHours, maxConsec, maxPresence) = [max(1, int(rng.normal(*distr[key])))
+                                          for key in ["maxHours", "maxConsec", "maxPresence"]]
+    (mean, increase, std) = distr["demand"]
+    means = mean + increase * np.arange(hoursDay) / hoursDay
+    demand = np.maximum(0, rng.normal(means, std).astype(np.int64))
+    return maxHours, maxConsec, maxPresence, demand
+
+
+def _buildWorkingDays(auxDemand, maxHours, maxConsec, maxPresence):
+    """
+    Builds, for each instance, the working day of generateFeasible1 for its remaining demand. The nurse works every hour
+    with demand and every single resting hour, rests after maxConsec hours and stops at maxHours worked hours or
+    maxPresence hours of presence. The hours are visited once for all the instances
+    :param auxDemand: Matrix with the remaining demand of each instance
+    :param maxHours: Vector with maxHours of each instance
+    :param maxConsec: Vector with maxConsec of each instance
+    :param maxPresence: Vector with maxPresence of each instance
+    :return: A boolean matrix with the working day of each instance and another one with the hours the nurse works
+    because there is demand (not to rest less than 2 hours)
+    """
+    (n, hoursDay) = auxDemand.shape
+    work = np.zeros((n, hoursDay), dtype=bool)
+    demandWork = np.zeros((n, hoursDay), dtype=bool)
+    worked = np.zeros(n, dtype=np.int64)
+    consec = np.zeros(n, dtype=np.int64)
+    presence = np.zeros(n, dtype=np.int64)
+    resting = np.zeros(n, dtype=bool)
+    done = np.zeros(n, dtype=bool)
+
+    for h in range(hoursDay):
+        forcedRest = ~done & (consec == maxConsec)
+        works = ~done & ~forcedRest & (resting | (auxDemand[:, h] > 0))
+        rests = forcedRest | (~done & ~works & (worked > 0))
+
+        work[works, h] = True
+        demandWork[works & ~resting, h] = True
+        worked += works
+        consec = np.where(works, consec + 1, np.where(rests, 0, consec))
+        presence += works | rests
+        resting = np.where(works, False, np.where(rests, True, resting))
+        done |= (worked == maxHours) | (presence == maxPresence)
+    return work, demandWork
+
+
+def coverDemand(demand, maxHours, maxConsec, maxPresence):
+    """
+    Vectorized version of the greedy covering of generateFeasible1 for a batch of instances. At each step, every
+    instance with remaining demand adds as many copies of its next working day as the demand of the hours it works
+    because of the demand allows
+    :param demand: Matrix with the demand of each instance
+    :param maxHours: Vector with maxHours of each instance
+    :param maxConsec: Vector with maxConsec of each instance
+    :param maxPresence: Vector with maxPresence of each instance
+    :return: A list with the NurseSchedule that covers the demand of each instance
+    """
+    (n, hoursDay) = demand.shape
+    auxDemand = np.array(demand, dtype=np.int64)
+    (listIdx, listMasks, listCopies) = ([], [], [])
+
+    pending = np.flatnonzero(auxDemand.sum(axis=1) > 0)
+    while len(pending) > 0:
+        (work, demandWork) = _buildWorkingDays(auxDemand[pending], maxHours[pending], maxConsec[pending],
+                                               maxPresence[pending])
+        copies = np.where(demandWork, auxDemand[pending], np.iinfo(np.int64).max).min(axis=1)
+        auxDemand[pending] = np.maximum(0, auxDemand[pending] - copies[:, None] * work)
+        listIdx.append(pending)
+        listMasks.append(matrixToMasks(work))
+        listCopies.append(copies)
+        pending = pending[auxDemand[pending].sum(axis=1) > 0]
+
+    if len(listIdx) == 0:
+        return [NurseSchedule([], hoursDay) for _ in range(n)]
+    idx = np.concatenate(listIdx)
+    masks = np.concatenate(listMasks)
+    copies = np.concatenate(listCopies)
+    order = np.argsort(idx, kind="stable")
+    limits = np.searchsorted(idx[order], np.arange(n + 1))
+    return [NurseSchedule(masks[order[limits[i]:limits[i+1]]], hoursDay,
+                          copies[order[limits[i]:limits[i+1]]]).compress() for i in range(n)]
+
+
+def _generateChunk(args):
+    """
+    Generates and checks the instances [start, stop) of a batch
+    :param args: Seed of the batch, start, stop, hoursDay and the distributions (see drawParams)
+    :return: A list with the params and the solution of each instance
+    """
+    (seed, start, stop, hoursDay, distr) = args
+    draws = [drawParams(getRng(seed, i), hoursDay, distr) for i in range(start, stop)]
+    (maxHours, maxConsec, maxPresence) = [np.array([draw[k] for draw in draws]) for k in range(3)]
+    demand = np.array([draw[3] for draw in draws]).reshape(len(draws), hoursDay)
+
+    result = []
+    for (i, nurses) in enumerate(coverDemand(demand, maxHours, maxConsec, maxPresence)):
+        hours = nurses.getHours()
+        params = {"minHours": int(hours.min()) if len(hours) > 0 else 0, "maxHours": int(maxHours[i]),
+                  "maxConsec": int(maxConsec[i]), "maxPresence": int(maxPresence[i]), "demand": demand[i].tolist(),
+                  "nNurses": len(nurses), "hoursDay": hoursDay}
+        # stops the generation if a generated instance is not OK
+        assert isFeasibleGeneratorOk(nurses, params)
+        result.append((params, nurses))
+    return result
+
+
+def generateBatch(numInstances, seed, hoursDay, distr, nThreads=1, chunkSize=100):
+    """
+    Generates a batch of feasible instances like generateFeasible1. The instances are split in chunks that are generated
+    and checked in parallel. The instance i only depends on the seed and i
+    :param numInstances: Number of instances
+    :param seed: Seed of the batch
+    :param hoursDay: Number of hours in a day
+    :param distr: Distributions of the params (see drawParams)
+    :param nThreads: Number of processes
+    :param chunkSize: Number of instances generated at once by a process
+    :return: An iterator over the params of each instance and a NurseSchedule with a possible solution, in order
+    """
+    chunks = [(seed, start, min(start + chunkSize, numInstances), hoursDay, distr)
+              for start in range(0, numInstances, chunkSize)]
+    if nThreads <= 1:
+        for chunk in chunks:
+            yield from _generateChunk(chunk)
+        return
+    with mp.Pool(nThreads) as pool:
+        for result in pool.imap(_generateChunk, chunks):
+            yield from result
@@ -1,6 +1,8 @@
 import random as rnd
 import copy
+from collections import Counter
 from otherScripts.checkingFunctions import *
+from otherScripts.nurseSchedule import NurseSchedule, matrixToMasks
 
 
 def generateFeasible1(distrDemand, distrMaxHours, distrMaxConsec, distrMaxPresence, hoursDay):
@@ -11,17 +13,19 @@ def generateFeasible1(distrDemand, distrMaxHours, distrMaxConsec, distrMaxPresen
     :param distrMaxConsec: Probabilistic distribution of maxConsec
     :param distrMaxPresence: Probabilistic distribution of maxPresence
     :param hoursDay: Number of hours in a day
-    :return: A dictionary containing the params of a feasible instance and the matrix of a possible solution
+    :return: A dictionary containing the params of a feasible instance and a NurseSchedule with a possible solution
     """
     maxHours = distrMaxHours.__next__()
     maxConsec = distrMaxConsec.__next__()
     maxPresence = distrMaxPresence.__next__()
     demand = [distrDemand.__next__() for _ in range(hoursDay)]
 
-    nurses = []
+    nurses = Counter()
     auxDemand = copy.copy(demand)
     while sum(auxDemand) > 0:
         nurse = []
+        # hours the nurse works because there is demand
+        demandHours = []
         workedHours = 0
         consecHours = 0
         presenceHours = 0
@@ -35,7 +39,8 @@ def generateFeasible1(distrDemand, distrMaxHours, distrMaxConsec, distrMaxPresen
 
             elif restHours == 1 or auxDemand[h] > 0:
                 nurse.append(1)
-                auxDemand[h] = max(0, auxDemand[h] - 1)
+                if restHours == 0:
+                    demandHours.append(h)
                 restHours = 0
                 workedHours += 1
                 presenceHours += 1
@@ -53,9 +58,16 @@ def generateFeasible1(distrDemand, distrMaxHours, distrMaxConsec, distrMaxPresen
             if workedHours == maxHours or presenceHours == maxPresence:
                 nurse += [0] * (hoursDay - len(nurse))
                 break
-        nurses.append(nurse)
 
-    minHours = min((sum(nurse) for nurse in nurses))
+        # the next nurses have the same working day until the demand of one of the hours she works because of it is
+        # covered
+        copies = min(auxDemand[h] for h in demandHours)
+        for (h, work) in enumerate(nurse):
+            auxDemand[h] = max(0, auxDemand[h] - copies * work)
+        nurses[int(matrixToMasks(nurse))] += copies
+    nurses = NurseSchedule.fromCounts(nurses, hoursDay)
+
+    minHours = int(nurses.getHours().min())
     nNurses = len(nurses)
     params = {"minHours": minHours, "maxHours": maxHours, "maxConsec": maxConsec, "maxPresence": maxPresence,
               "demand": demand, "nNurses": nNurses, "hoursDay": hoursDay}
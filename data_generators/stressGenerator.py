@@ -0,0 +1,70 @@
+import numpy as np
+from otherScripts.checkingFunctions import isFeasibleGeneratorOk
+from otherScripts.nurseSchedule import NurseSchedule, matrixToMasks
+from metaheuristicas import patternsNurses
+from data_generators.batchGenerator import getRng
+
+
+def getGeometricSizes(minNurses, maxNurses, numSizes):
+    """
+    :param minNurses: Number of nurses of the smallest instances
+    :param maxNurses: Number of nurses of the largest instances
+    :param numSizes: Number of sizes
+    :return: A list with the number of nurses of each size, with a constant ratio between consecutive sizes
+    """
+    return sorted(set(int(round(size)) for size in np.geomspace(minNurses, maxNurses, numSizes)))
+
+
+def generateStressInstance(rng, nNurses, demandLevel, constraints, hoursDay):
+    """
+    Creates a feasible instance from nNurses working days drawn from the table of feasible working days of some
+    constraints. The demand is a proportion of the offer of these nurses, so they are a solution of the instance
+    :param rng: Random generator of the instance
+    :param nNurses: Number of nurses
+    :param demandLevel: Proportion of the offer of the drawn nurses that is demanded (between 0 and 1)
+    :param constraints: Dictionary with minHours, maxHours, maxConsec and maxPresence
+    :param hoursDay: Number of hours in a day
+    :return: A dictionary containing the params of the instance and a NurseSchedule with a possible solution
+    """
+    patterns = patternsNurses.getPatterns(constraints["minHours"], constraints["maxHours"], constraints["maxConsec"],
+                                          constraints["maxPresence"])
+    placements = patternsNurses.getPlacements(patterns, hoursDay)
+    if len(placements) == 0:
+        raise ValueError("There isn't any feasible working day for " + str(constraints))
+
+    counts = np.bincount(rng.integers(0, len(placements), nNurses), minlength=len(placements))
+    drawn = counts > 0
+    nurses = NurseSchedule(matrixToMasks(placements[drawn]), hoursDay, counts[drawn]).compress()
+    demand = np.floor(demandLevel * nurses.getOffer()).astype(np.int64)
+
+    params = {"minHours": constraints["minHours"], "maxHours": constraints["maxHours"],
+              "maxConsec": constraints["maxConsec"], "maxPresence": constraints["maxPresence"],
+              "demand": demand.tolist(), "nNurses": nNurses, "hoursDay": hoursDay}
+    return params, nurses
+
+
+def generateStressFamilies(seed, hoursDay, sizes, demandLevels, tightness, numReplicas=1):
+    """
+    Generates the instances of every combination of size, demand level and tightness. The instance i only depends on
+    the seed and i
+    :param seed: Seed of the families
+    :param hoursDay: Number of hours in a day
+    :param sizes: List with the number of nurses of each size (see getGeometricSizes)
+    :param demandLevels: List with the demand levels (see generateStressInstance)
+    :param tightness: Dictionary with the constraints of each tightness level
+    :param numReplicas: Number of instances of each combination
+    :return: An iterator over the name, the params and a NurseSchedule with a possible solution of each instance
+    """
+    i = 0
+    for (level, constraints) in tightness.items():
+        for nNurses in sizes:
+            for demandLevel in demandLevels:
+                for replica in range(numReplicas):
+                    (params, nurses) = generateStressInstance(getRng(seed, i), nNurses, demandLevel, constraints,
+                                                              hoursDay)
+                    # stops the generation if a generated instance is not OK
+                    assert isFeasibleGeneratorOk(nurses, params)
+                    name = "stress_" + level + "_" + str(nNurses) + "_" + str(int(round(100 * demandLevel))) + "_" + \
+                           str(replica + 1) + ".dat"
+                    yield name, params, nurses
+                    i += 1
@@ -1,19 +1,59 @@
 import os
 import sys
 from data_generators.generator import *
+from data_generators.batchGenerator import generateBatch
+from data_generators.stressGenerator import getGeometricSizes, generateStressFamilies
+from otherScripts.instanceStore import InstanceStore
 from paramsMainGenerators import *
 
 
 def usage():
     print("Usage:")
-    print('python3 mainGenerators.py "generator" "numInstances"')
+    print('python3 mainGenerators.py "generator" "numInstances" [-s "storeFile"] [-r "seed"]')
+    print('python3 mainGenerators.py -e "storeFile" "folder"')
     print("The generator can be:")
     print("0 -> Random")
     print("1 -> Feasible 1")
     print("2 -> Feasible 2")
+    print("3 -> Feasible 1 in batch (vectorized and parallel)")
+    print("4 -> Stress families (numInstances instances of each size, demand level and tightness)")
+    print("Options:")
+    print('-s "storeFile" Append the instances to an instance store instead of writing .dat files')
+    print('-e "storeFile" "folder" Export the instances of an instance store as .dat files')
+    print('-r "seed" Seed of the batch and stress generators. The same seed gives the same instances (0 by default)')
 
 
 if __name__ == '__main__':
+    # export an instance store
+    if len(sys.argv) == 4 and sys.argv[1] == "-e":
+        InstanceStore(sys.argv[2]).exportAll(sys.argv[3])
+        exit(0)
+
+    # instance store
+    if "-s" in sys.argv:
+        idxStore = sys.argv.index("-s") + 1
+        if idxStore >= len(sys.argv):
+            print("Missing the store file")
+            exit(1)
+        store = InstanceStore(sys.argv[idxStore], hoursDay)
+        sys.argv.remove(sys.argv[idxStore])
+        sys.argv.remove("-s")
+    else:
+        store = None
+
+    # seed of the batch and stress generators
+    if "-r" in sys.argv:
+        idxSeed = sys.argv.index("-r") + 1
+        try:
+            seed = int(sys.argv[idxSeed])
+        except (IndexError, ValueError):
+            print("Invalid value for the seed")
+            exit(1)
+        sys.argv.remove(sys.argv[idxSeed])
+        sys.argv.remove("-r")
+    else:
+        seed = 0
+
     if len(sys.argv) < 3:
         print("Not enough parameters")
         usage()
@@ -25,7 +65,7 @@ if __name__ == '__main__':
         exit(1)
 
     generator = sys.argv[1]
-    if generator not in ['0', '1', '2']:
+    if generator not in ['0', '1', '2', '3', '4']:
         print("Invalid parameter for generator", generator)
         exit(1)
 
@@ -37,16 +77,37 @@ if __name__ == '__main__':
         exit(1)
 
     folder = "data_generators/autoGeneratedData/"
-    if not os.path.exists(folder):
+    if store is None and not os.path.exists(folder):
         os.makedirs(folder)
 
+    def write(params, feasibility, name, cost=-1):
+        if store is None:
+            writeParams(params, feasibility, folder + name, cost)
+        else:
+            store.append(name, params, feasibility, cost)
+
+    # using the batch generator
+    if generator == '3':
+        batch = generateBatch(numInstances, seed, hoursDay, batchDistr, batchNThreads, batchChunkSize)
+        for (i, (params, nurses)) in enumerate(batch):
+            write(params, "FEASIBLE", "batch_" + str(seed) + "_" + str(i+1) + ".dat", nurses.getNumWorkingNurses())
+        exit(0)
+
+    # using the stress families
+    if generator == '4':
+        families = generateStressFamilies(seed, hoursDay, getGeometricSizes(*stressSizes), stressDemandLevels,
+                                          stressTightness, numInstances)
+        for (name, params, nurses) in families:
+            write(params, "FEASIBLE", name, nurses.getNumWorkingNurses())
+        exit(0)
+
     for i in range(numInstances):
         # using random generator
         if generator == '0':
             name = "random_" + str(i+1) + ".dat"
             params = generateRandom(distrDemand, distrMinHours, distrMaxHours,
                                     distrMaxConsec, distrMaxPresence, hoursDay)
-            writeParams(params, "RANDOM", folder + name, -1)
+            write(params, "RANDOM", name, -1)
 
         # using generateFeasible1
         elif generator == '1':
@@ -54,8 +115,8 @@ if __name__ == '__main__':
             (params, nurses) = generateFeasible1(distrDemand, distrMaxHours, distrMaxConsec, distrMaxPresence, hoursDay)
             # stops the program if a generated instance is not OK
             assert isFeasibleGeneratorOk(nurses, params)
-            cost = sum(sum(nurse) > 0 for nurse in nurses)
-            writeParams(params, "FEASIBLE", folder + name, cost)
+            cost = nurses.getNumWorkingNurses()
+            write(params, "FEASIBLE", name, cost)
 
         # using generateFeasible2
         elif generator == '2':
@@ -64,4 +125,4 @@ if __name__ == '__main__':
             # stops the program if a generated instance is not OK
             assert isFeasibleGeneratorOk(nurses, params)
             cost = sum(sum(nurse) > 0 for nurse in nurses)
-            writeParams(params, "FEASIBLE", folder + name, cost)
+            write(params, "FEASIBLE", name, cost)
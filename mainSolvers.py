@@ -6,12 +6,15 @@ from otherScripts.utils import *
 def usage():
     print("Usage:")
     print('python3 mainSolvers.py "folderWithInstances" "solver" [options]')
+    print('"folderWithInstances" can also be an instance store created by mainGenerators.py')
     print("The solver can be 'grasp', 'brkga' or 'opl'")
     print("Options:")
     print("-v Verbose mode")
     print("-h Show the usage")
-    print("-w Write the results in a file")
+    print("-w Write the results in a file. The instances already in the file with the same solver, params and time are"
+          " skipped")
     print('-t "number" Maximum amount of time for the solver in minutes')
+    print('-p "number" Number of instances solved at the same time')
 
 if __name__ == '__main__':
     if len(sys.argv) < 3:
@@ -23,14 +26,12 @@ if __name__ == '__main__':
         usage()
         exit(0)
 
-    # Data folder
+    # Data folder or instance store
     dataFolder = sys.argv[1]
-    try:
-        os.listdir(dataFolder)
-    except FileNotFoundError:
+    if not os.path.exists(dataFolder):
         print("The data folder", dataFolder, "doesn't exists")
         exit(1)
-    if dataFolder[-1] != '/':
+    if os.path.isdir(dataFolder) and dataFolder[-1] != '/':
         dataFolder = dataFolder + '/'
 
     # Solver
@@ -60,6 +61,17 @@ if __name__ == '__main__':
     else:
         maxTime = math.inf
 
+    # batch mode
+    if "-p" in sys.argv:
+        idxWorkers = sys.argv.index("-p") + 1
+        try:
+            batchParams['nWorkers'] = int(sys.argv[idxWorkers])
+        except (IndexError, ValueError):
+            print("Invalid value for the number of instances solved at the same time")
+            exit(1)
+        sys.argv.remove(sys.argv[idxWorkers])
+        sys.argv.remove('-p')
+
     # verbose
     if '-v' not in sys.argv:
         disableVervose()
@@ -77,4 +89,4 @@ if __name__ == '__main__':
         print("Invalid option:", sys.argv[3])
         exit(1)
 
-    executeSolver(dataFolder, solver, maxTime, params, fileName)
\ No newline at end of file
+    executeSolver(dataFolder, solver, maxTime, params, fileName, batchParams)
\ No newline at end of file
@@ -1,7 +1,7 @@
 import math
-import itertools as ittls
+import numpy as np
 from otherScripts.utils import eprint
-from otherScripts.checkingFunctions import getOffer
+from otherScripts.nurseSchedule import NurseSchedule
 
 
 def getChrLength(params):
@@ -58,19 +58,19 @@ def createProportionDemand(demand, maxPresence, maxHours, lastInitHour):
     return sumIni / (sumIni + sumFi), firstHalf, secondHalf
 
 
-def decode(population, params):
+def getDecoderTables(params):
     """
-    Deocder for the nurses optimization problem
-    :param population: [{'chr': chromosome, ...}, {...}, ...]
-    :param params: Dictionary with hoursDay, minHours, maxHours, maxConsec, maxPresence, demand and nNurses
-    :return: [{'chr': chromosome, 'solution': solution, 'fitness': fitness}, ...]
+    Gets the tables the decoder needs for an instance. The thresholds for the starting hour are computed only once and
+    stored in params
+    :param params: Dictionary with hoursDay, maxHours, maxConsec, maxPresence and demand
+    :return: A tuple with the number of hours a working nurse does, the length of an encoded nurse, the threshold that
+    determines if a nurse is reversed and the thresholds for the first and the second half of the day
     """
     hoursDay = params['hoursDay']
     maxHours = params["maxHours"]
     maxConsec = params["maxConsec"]
     maxPresence = params["maxPresence"]
     demand = params["demand"]
-    nNurses = params['nNurses']
 
     # Sometimes it's impossible to work exactly maxHours
     maxHours = int(min(maxHours, maxPresence - math.ceil(maxPresence / maxConsec) + 1))
@@ -83,82 +83,226 @@ def decode(population, params):
 
     lenWorkingDay = min(maxPresence, maxHours * 2 - 1)
     if 'propHalf' not in params or 'firstHalf' not in params or 'secondHalf' not in params:
-        (propHalf, firstHalf, secondHalf) = createProportionDemand(demand, lenWorkingDay, maxHours, lastInitHour)
+        (propHalf, firstHalf, secondHalf) = createProportionDemand(list(demand), lenWorkingDay, maxHours, lastInitHour)
         params['propHalf'] = propHalf
-        params['firstHalf'] = firstHalf
-        params['secondHalf'] = secondHalf
+        params['firstHalf'] = np.array(firstHalf)
+        params['secondHalf'] = np.array(secondHalf)
+
+    return maxHours, maxLenEncNurse, params['propHalf'], params['firstHalf'], params['secondHalf']
+
+
+def _isDecodable(thresholds, hour):
+    """
+    :param thresholds: Thresholds for one half of the day
+    :param hour: Starting hour
+    :return: True if some value is decoded by the thresholds as the given starting hour
+    """
+    return hour < len(thresholds) and (thresholds[hour] > 0 if hour == 0 else thresholds[hour - 1] < thresholds[hour])
+
+
+def _encodeThreshold(thresholds, hour):
+    """
+    Chooses a random value that the thresholds decode as the given starting hour. If no value gives that hour, the
+    closest hour that can be decoded is used
+    :param thresholds: Thresholds for one half of the day
+    :param hour: Starting hour
+    :return: A value in [0, 1]
+    """
+    lower = np.concatenate(([0], thresholds[:-1]))
+    feasibleHours = np.flatnonzero(lower < thresholds)
+    hour = feasibleHours[np.argmin(np.abs(feasibleHours - hour))]
+    return np.random.uniform(lower[hour], thresholds[hour]) if lower[hour] > 0 else thresholds[hour] / 2
+
+
+def _getChunks(nurse, initHour):
+    """
+    :param nurse: A list. The element i is 1 if the nurse works at time i
+    :param initHour: First working hour of the nurse
+    :return: A list with the lengths of the groups of consecutive hours, from the starting hour
+    """
+    chunksHours = []
+    for (h, work) in enumerate(nurse[initHour:]):
+        if work and (h == 0 or not nurse[initHour + h - 1]):
+            chunksHours.append(0)
+        if work:
+            chunksHours[-1] += 1
+    return chunksHours
+
+
+def encode(nurses, params):
+    """
+    Encoder for the nurses optimization problem. It's the inverse of decode: it gives a chromosome whose decoded
+    solution is as close as possible to the given one. The decoder always assigns the same number of hours to every
+    working nurse, so the nurses that work less hours are decoded with their groups of consecutive hours enlarged
+    proportionally
+    :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param params: Dictionary with hoursDay, minHours, maxHours, maxConsec, maxPresence, demand and nNurses
+    :return: The chromosome
+    """
+    hoursDay = params['hoursDay']
+    maxConsec = params["maxConsec"]
+    nNurses = params['nNurses']
+    (_, maxLenEncNurse, propHalf, firstHalf, secondHalf) = getDecoderTables(params)
+
+    # By default, the nurses don't work
+    chromosome = np.random.rand(nNurses, maxLenEncNurse)
+    chromosome[:, 0] *= 0.3
+
+    workingNurses = [nurse for nurse in nurses if sum(nurse) > 0]
+    for (k, nurse) in enumerate(workingNurses[:nNurses]):
+        nurse = list(nurse)
+        firstHour = nurse.index(1)
+        lastHour = hoursDay - 1 - nurse[::-1].index(1)
+
+        # Candidate orientations: (reversed, working day, starting hour, thresholds). The nurses that start late are
+        # tried first as reversed
+        candidates = [(False, nurse, firstHour, firstHalf), (True, nurse[::-1], hoursDay - 1 - lastHour, secondHalf)]
+        if firstHour >= len(firstHalf):
+            candidates.reverse()
+
+        # An orientation is valid if its starting hour can be decoded and all the groups of consecutive hours fit in the
+        # encoded nurse. Otherwise, the one that drops less groups is used
+        options = []
+        for (revers, oriented, initHour, thresholds) in candidates:
+            chunksHours = _getChunks(oriented, initHour)
+            lenEncNurse = min(maxLenEncNurse, int(math.ceil((hoursDay - initHour + 1) / (maxConsec + 1))) + 2)
+            key = (_isDecodable(thresholds, initHour), -max(0, len(chunksHours) - (lenEncNurse - 2)))
+            options.append((key, revers, initHour, chunksHours[:lenEncNurse - 2]))
+        (_, revers, initHour, chunksHours) = max(options, key=lambda option: option[0])
+
+        if revers:
+            prob = _encodeThreshold(secondHalf, initHour)
+            chromosome[k, 1] = propHalf + prob * (1 - propHalf)
+        else:
+            chromosome[k, 1] = _encodeThreshold(firstHalf, initHour) * propHalf
+
+        chromosome[k, 0] = np.random.uniform(0.3, 1)
+        chromosome[k, 2:] = 0
+        chromosome[k, 2:2 + len(chunksHours)] = np.array(chunksHours) / sum(chunksHours)
+
+    return chromosome.ravel()
+
+
+def decode(population, params, withSolutions=True):
+    """
+    Deocder for the nurses optimization problem. It decodes all the population at once
+    :param population: Matrix with one chromosome per row
+    :param params: Dictionary with hoursDay, minHours, maxHours, maxConsec, maxPresence, demand and nNurses
+    :param withSolutions: If False, only the fitness is calculated and the working days of the nurses are not built
+    :return: A vector with the fitness of each individual and a list with the NurseSchedule of each one (None if
+    withSolutions is False)
+    """
+    hoursDay = params['hoursDay']
+    maxConsec = params["maxConsec"]
+    demand = np.asarray(params["demand"])
+    nNurses = params['nNurses']
+    (workedHours, maxLenEncNurse, propHalf, firstHalf, secondHalf) = getDecoderTables(params)
+
+    # One row per encoded nurse
+    population = np.asarray(population)
+    nIndividuals = len(population)
+    encodedNurses = population.reshape(nIndividuals * nNurses, maxLenEncNurse)
+    works = encodedNurses[:, 0] >= 0.3  # if the nurse works
+
+    # Get the starting hour
+    revers = encodedNurses[:, 1] > propHalf  # the nurse is reversed
+    initHour = np.where(revers,
+                        np.searchsorted(secondHalf, (encodedNurses[:, 1] - propHalf) / (1 - propHalf)),
+                        np.searchsorted(firstHalf, encodedNurses[:, 1] / propHalf))
+    initHour = np.minimum(initHour, len(firstHalf) - 1)
+
+    # Number of groups of consecutive hours each nurse can use
+    lenEncNurse = np.minimum(maxLenEncNurse, np.ceil((hoursDay - initHour + 1) / (maxConsec + 1)).astype(int) + 2)
+    usedChunks = np.arange(maxLenEncNurse - 2) < (lenEncNurse - 2)[:, None]
+    encConsecHours = np.where(usedChunks, encodedNurses[:, 2:], 0)  # the chunks of consecutive hours encoded
+    normEncodedNurse = encConsecHours / encConsecHours.sum(axis=1, keepdims=True)
+
+    # Assign proportionally to each element of normEncodedNurse the length of a group of consecutive hours
+    chunksHours = np.minimum(maxConsec, np.floor(normEncodedNurse * workedHours)).astype(int)
+    normEncodedNurse -= chunksHours / workedHours
+
+    # Assign the remaining hours to the groups of consecutive hours that are not full, in rounds that follow the
+    # descending order of the remainders
+    order = np.argsort(np.where(usedChunks, -normEncodedNurse, math.inf), axis=1, kind='stable')
+    sortedUsed = np.take_along_axis(usedChunks, order, axis=1)
+    remainingHours = workedHours - chunksHours.sum(axis=1)
+    while True:
+        sortedChunks = np.take_along_axis(chunksHours, order, axis=1)
+        notFull = sortedUsed & (sortedChunks < maxConsec) & (remainingHours > 0)[:, None]
+        if not notFull.any():
+            break
+        give = notFull & (np.cumsum(notFull, axis=1) <= remainingHours[:, None])
+        np.put_along_axis(chunksHours, order, sortedChunks + give, axis=1)
+        remainingHours -= give.sum(axis=1)
+
+    # Place the groups of consecutive hours. Every group is separated from the previous one by a resting hour
+    chunksHours[~works] = 0
+    separators = np.cumsum(chunksHours > 0, axis=1) - 1
+    endChunk = initHour[:, None] + np.cumsum(chunksHours, axis=1) + np.maximum(separators, 0)
+    beginChunk = endChunk - chunksHours
+
+    offer = _getOffer(beginChunk, endChunk, revers, nIndividuals, nNurses, hoursDay)
+    if withSolutions:
+        masks = _buildNurses(beginChunk, endChunk, revers, hoursDay).reshape(nIndividuals, nNurses)
+        nurses = [NurseSchedule(row, hoursDay).compress() for row in masks]
     else:
-        propHalf = params['propHalf']
-        firstHalf = params['firstHalf']
-        secondHalf = params['secondHalf']
-
-    listSolutions = []
-    populationChr = (ind['chr'] for ind in population)
-    for encodedSetNurses in populationChr:
-        nurses = []
-        nWorkNurses = nNurses
-        for i in range(0, len(encodedSetNurses), maxLenEncNurse):
-            encodedNurse = encodedSetNurses[i:i + maxLenEncNurse]
-            works = encodedNurse[0] >= 0.3  # if the nurse works
-
-            if works:
-                # Get the starting hour
-                revers = encodedNurse[1] > propHalf  # the nurse is reversed
-                if not revers:
-                    prob = encodedNurse[1] / propHalf
-                    initHour = ittls.dropwhile(lambda x: x[1] < prob, enumerate(firstHalf)).__next__()[0]
-                else:
-                    prob = (encodedNurse[1] - propHalf) / (1 - propHalf)
-                    initHour = ittls.dropwhile(lambda x: x[1] < prob, enumerate(secondHalf)).__next__()[0]
-
-                lenEncNurse = min(maxLenEncNurse, int(math.ceil((hoursDay - initHour + 1) / (maxConsec + 1))) + 2)
-                encConsecHours = encodedNurse[2:lenEncNurse]  # the chunks of consecutive hours encoded
-                workedHours = maxHours  # number of hours the nurse works
-                s = sum(encConsecHours)
-                normEncodedNurse = [x / s for x in encConsecHours]
-                chunksHours = [0] * len(normEncodedNurse)  # length of each group of consecutive hours
-
-                # Assign proportionally to each element of normEncodedNurse the length of a group of consecutive hours
-                for j in range(len(normEncodedNurse)):
-                    chunksHours[j] = min(maxConsec, int(normEncodedNurse[j] * workedHours))
-                    normEncodedNurse[j] -= chunksHours[j] / workedHours
-
-                # Assign the remaining hours to the groups of consecutive hours that are not full
-                sortedAux = sorted(enumerate(normEncodedNurse), key=lambda x: x[1], reverse=True)
-                remainingHours = workedHours - sum(chunksHours)
-                # I have to be sure that this will not become an infinite loop
-                while remainingHours > 0:
-                    for (j, x) in sortedAux:
-                        if chunksHours[j] < maxConsec:
-                            chunksHours[j] += 1
-                            remainingHours -= 1
-                            if remainingHours == 0:
-                                break
-            else:
-                initHour = 0
-                chunksHours = []
-                revers = False
-                nWorkNurses -= 1
-
-            # Construct the nurse
-            nurse = [0] * initHour
-            for (j, chunk) in enumerate(filter(lambda x: x != 0, chunksHours)):
-                nurse += [0] * (j != 0) + [1] * chunk
-            nurse += [0] * (hoursDay - len(nurse))
-            if revers:
-                nurse.reverse()
-            nurses.append(nurse)
-
-        # calculate the dictionary we'll add to listSolutions
-        offer = getOffer(nurses)
-        uncovDemand = sum(max(0, demand[i] - offer[i]) for i in range(len(demand)))
-        extraOffer = sum((offer[i] - demand[i]) ** 2 for i in range(len(demand)) if offer[i] > demand[i] + 1)
-        solution = {'chr': encodedSetNurses, 'solution': nurses,
-                    'fitness': uncovDemand * nNurses ** 2 + extraOffer + nWorkNurses}
-        listSolutions.append(solution)
-
-    offer = getOffer(listSolutions[0]['solution'])
-    diff = [offer[j] - demand[j] for j in range(len(demand))]
-    eprint("Diff:", diff)
-
-    return listSolutions
+        nurses = None
+
+    # calculate the fitness of every individual
+    uncovDemand = np.maximum(0, demand - offer).sum(axis=1)
+    extraOffer = np.where(offer > demand + 1, (offer - demand) ** 2, 0).sum(axis=1)
+    nWorkNurses = works.reshape(nIndividuals, nNurses).sum(axis=1)
+    fitness = uncovDemand * nNurses ** 2 + extraOffer + nWorkNurses
+
+    if nIndividuals > 0:
+        eprint("Diff:", list(offer[0] - demand))
+
+    return fitness, nurses
+
+
+def _buildNurses(beginChunk, endChunk, revers, hoursDay):
+    """
+    Builds the working day of every nurse from its groups of consecutive hours
+    :param beginChunk: Matrix with the first hour of each group of consecutive hours (one row per nurse)
+    :param endChunk: Matrix with the hour after the last one of each group of consecutive hours
+    :param revers: Vector that tells if each nurse is reversed
+    :param hoursDay: Number of hours in a day
+    :return: A vector with the bitmask of each nurse. The bit h is 1 if the nurse works at the hour h
+    """
+    (beginChunk, endChunk) = _placeChunks(beginChunk, endChunk, revers, hoursDay)
+    one = np.uint64(1)
+    chunkMasks = (one << endChunk.astype(np.uint64)) - (one << beginChunk.astype(np.uint64))
+    return np.bitwise_or.reduce(chunkMasks, axis=1)
+
+
+def _placeChunks(beginChunk, endChunk, revers, hoursDay):
+    """
+    Places the groups of consecutive hours in the day. The hours after the end of the day are lost, and a reversed
+    group [b, e) becomes [hoursDay - e, hoursDay - b)
+    :return: The first hour and the hour after the last one of each group of consecutive hours
+    """
+    beginChunk = np.minimum(beginChunk, hoursDay)
+    endChunk = np.minimum(endChunk, hoursDay)
+    return (np.where(revers[:, None], hoursDay - endChunk, beginChunk),
+            np.where(revers[:, None], hoursDay - beginChunk, endChunk))
+
+
+def _getOffer(beginChunk, endChunk, revers, nIndividuals, nNurses, hoursDay):
+    """
+    Gets the number of nurses that work at each hour for every individual without building the working days
+    :param beginChunk: Matrix with the first hour of each group of consecutive hours (one row per nurse)
+    :param endChunk: Matrix with the hour after the last one of each group of consecutive hours
+    :param revers: Vector that tells if each nurse is reversed
+    :param nIndividuals: Number of individuals. The nurses of an individual are in consecutive rows
+    :param nNurses: Number of nurses of each individual
+    :param hoursDay: Number of hours in a day
+    :return: A matrix (nIndividuals x hoursDay) with the offer of each individual
+    """
+    (beginChunk, endChunk) = _placeChunks(beginChunk, endChunk, revers, hoursDay)
+
+    # +1 where a group begins and -1 where it ends. The cumulative sum gives the offer
+    rowOffset = (np.arange(len(beginChunk)) // nNurses * (hoursDay + 1))[:, None]
+    changes = np.bincount(np.concatenate(((rowOffset + beginChunk).ravel(), (rowOffset + endChunk).ravel())),
+                          weights=np.concatenate((np.ones(beginChunk.size), -np.ones(endChunk.size))),
+                          minlength=nIndividuals * (hoursDay + 1))
+    return np.cumsum(changes.reshape(nIndividuals, hoursDay + 1), axis=1)[:, :hoursDay].round().astype(int)
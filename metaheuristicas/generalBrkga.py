@@ -1,19 +1,65 @@
 import math
 import numpy as np
 import time
-from otherScripts.utils import eprint
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from otherScripts.utils import *
+from otherScripts.checkpoint import *
+
+
+# State of a process of the decoding pool. The population is read from the shared memory block of the parent process
+_worker = {}
+
+
+def _initWorker(decode, data, shmName, shape, verbose):
+    """
+    Initializes a process of the decoding pool
+    :param decode: Decoder for the problem
+    :param data: Data defining the problem
+    :param shmName: Name of the shared memory block containing the population
+    :param shape: Shape of the population matrix stored in the shared memory block
+    :param verbose: If the process has to print its messages
+    """
+    if not verbose:
+        disableVervose()
+    shm = shared_memory.SharedMemory(name=shmName)
+    _worker['shm'] = shm
+    _worker['population'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker['decode'] = decode
+    _worker['data'] = data
+    # Decoding an empty population lets the decoder compute and keep in data its tables for this instance
+    decode(_worker['population'][:0], data, False)
+
+
+def _decodeRows(rows):
+    """
+    Decodes a range of rows of the shared population
+    :param rows: Tuple with the first row and the row after the last one
+    :return: The fitness of the individuals in the range
+    """
+    (begin, end) = rows
+    return _worker['decode'](_worker['population'][begin:end], _worker['data'], False)[0]
 
 
 class Brkga:
     def __init__(self, decode):
         """
-        :param decode: Decoder for the problem
+        :param decode: Decoder for the problem. It receives the population matrix (one chromosome per row), the data
+        of the problem and if the solutions have to be built, and returns a vector with the fitness of each individual
+        and their solutions (indexable by the position of the individual) or None
         """
         self.decode = decode
-        self.population = []
+        # One chromosome per row, with its fitness in the same position of fitness
+        self.population = np.empty((0, 0))
+        self.fitness = np.empty(0)
+        # Pool of processes used to decode the population and the shared copy of the population they read
+        self._pool = None
+        self._nThreads = 1
+        self._sharedPopulation = None
 
     def run(self, data, chrLength, numIndividuals=100, maxGenerations=100, eliteProp=0.1, mutantsProp=0.2,
-            inheritanceProb=0.7, timeLimit=math.inf, maxItWithoutImpr=50):
+            inheritanceProb=0.7, timeLimit=math.inf, maxItWithoutImpr=50, nThreads=1, migrationInterval=0,
+            exchange=None, checkpointFile=None, checkpointInterval=5, initialPopulation=None, isOptimal=None):
         """
         Executes the BRKGA algorithm
         :param data: Data defining the problem. It's a dictionary of parameters.
@@ -25,75 +71,209 @@ class Brkga:
         :param inheritanceProb: Probability of inheriting from an elite individual
         :param timeLimit: Maximum amount of time to do the computations
         :param maxItWithoutImpr: Maximum number of iterations without finding an improvement
+        :param nThreads: Number of processes used to decode the population
+        :param migrationInterval: Number of generations between two migrations (0 means no migration)
+        :param exchange: Function used to migrate. It receives the elite chromosomes (from best to worst) and returns a
+        matrix with the chromosomes of the immigrants, which replace the last individuals of the next generation
+        :param checkpointFile: File where the state of the algorithm is periodically saved. If it exists when the
+        algorithm starts, the execution is resumed from it. It's removed when the execution finishes
+        :param checkpointInterval: Minimum number of seconds between two checkpoints
+        :param initialPopulation: Matrix with chromosomes (one per row) that replace the first random individuals of
+        the initial population
+        :param isOptimal: Function that receives a solution and returns True if it is known to be optimal. When the
+        best individual improves its solution is checked, and the algorithm stops if it's optimal
         :return: The best individual found
         """
 
-        initTime = time.time()
-
         # Get numElite, numMutants and numCrossover from the proportions
         numElite = int(math.ceil(numIndividuals * eliteProp))
         numMutants = int(math.ceil(numIndividuals * mutantsProp))
         numCrossover = max(numIndividuals - numElite - numMutants, 0)
 
-        self.population = self._initializePopulation(numIndividuals, chrLength)
-        evol = [math.inf]
-        itWithoutImpr = 0
+        if nThreads > 1:
+            self._startPool(data, max(numIndividuals, numElite + numMutants), chrLength, nThreads)
+        try:
+            result = self._evolve(data, chrLength, numIndividuals, maxGenerations, numElite, numMutants, numCrossover,
+                                  inheritanceProb, timeLimit, maxItWithoutImpr, migrationInterval, exchange,
+                                  checkpointFile, checkpointInterval, initialPopulation, isOptimal)
+        finally:
+            self._stopPool()
+        removeCheckpoint(checkpointFile)
+        return result
 
-        for i in range(maxGenerations):
-            self.population = self.decode(self.population, data)
-            evol.append(self._getBestFitness()['fitness'])
+    def _evolve(self, data, chrLength, numIndividuals, maxGenerations, numElite, numMutants, numCrossover,
+                inheritanceProb, timeLimit, maxItWithoutImpr, migrationInterval, exchange, checkpointFile,
+                checkpointInterval, initialPopulation, isOptimal):
+        """
+        Main loop of the BRKGA algorithm. The parameters are the ones of run
+        :return: The cost and the solution of the best individual found
+        """
+        # The first numDecoded individuals of the population (the elite carried over) are already decoded
+        checkpoint = loadCheckpoint(checkpointFile)
+        if checkpoint is None:
+            initTime = time.time()
+            self.population = self._initializePopulation(numIndividuals, chrLength, initialPopulation)
+            evol = [math.inf]
+            itWithoutImpr = 0
+            firstGeneration = 0
+            numDecoded = 0
+        else:
+            initTime = time.time() - float(checkpoint['elapsedTime'])
+            self.population = checkpoint['population']
+            self.fitness = checkpoint['fitness']
+            evol = [float(checkpoint['bestFitness'])]
+            itWithoutImpr = int(checkpoint['itWithoutImpr'])
+            firstGeneration = int(checkpoint['generation'])
+            numDecoded = len(self.fitness)
+            setRandomState(checkpoint)
+            eprint("Resuming from generation", firstGeneration)
+        lastCheckpoint = time.time()
+
+        for i in range(firstGeneration, maxGenerations):
+            self._decodeNewIndividuals(data, numDecoded)
+            evol.append(self.fitness[self._getBestIndex()])
 
             eprint("Generation", i, "| MaxFitness", evol[-1])
             if evol[-2] > evol[-1]:
                 itWithoutImpr = 0
+                optimal = isOptimal is not None and isOptimal(self.getSolutions([self._getBestIndex()], data)[0])
             else:
                 itWithoutImpr += 1
+                optimal = False
 
-            elite, nonelite = self._classifyIndividuals(numElite)
+            (elite, nonelite) = self._classifyIndividuals(numElite)
             mutants = self._generateMutantIndividuals(numMutants, chrLength)
-            crossover = self._doCrossover(elite, nonelite, inheritanceProb, numCrossover)
-            self.population = elite + crossover + mutants
+            crossover = self._doCrossover(self.population[elite], self.population[nonelite], inheritanceProb,
+                                          numCrossover)
+            self.population = np.vstack((self.population[elite], crossover, mutants))
+            self.fitness = self.fitness[elite]
+            numDecoded = len(elite)
+
+            if exchange is not None and migrationInterval > 0 and (i + 1) % migrationInterval == 0:
+                self._receiveImmigrants(exchange(self.population[:numDecoded]), numDecoded)
 
-            if time.time() - initTime > timeLimit or itWithoutImpr > maxItWithoutImpr:
+            if checkpointFile is not None and time.time() - lastCheckpoint >= checkpointInterval:
+                saveCheckpoint(checkpointFile, population=self.population, fitness=self.fitness,
+                               bestFitness=evol[-1], itWithoutImpr=itWithoutImpr, generation=i + 1,
+                               elapsedTime=time.time() - initTime, **getRandomState())
+                lastCheckpoint = time.time()
+
+            if time.time() - initTime > timeLimit or itWithoutImpr > maxItWithoutImpr or optimal:
                 break
 
-        self.population = self.decode(self.population, data)
-        bestIndividual = self._getBestFitness()
+        self._decodeNewIndividuals(data, numDecoded)
+        idxBest = self._getBestIndex()
+        bestSolution = self.getSolutions([idxBest], data)[0]
 
-        eprint("Best individual:", bestIndividual)
+        eprint("Best individual:", self.fitness[idxBest], bestSolution)
 
-        bestSolution = bestIndividual['solution']
-        bestCost = sum(sum(nurse) != 0 for nurse in bestSolution)
+        bestCost = bestSolution.getNumWorkingNurses()
         return bestCost, bestSolution
 
+    def _receiveImmigrants(self, immigrants, numDecoded):
+        """
+        Replaces the last individuals of the population with the immigrants. The elite individuals are never replaced
+        :param immigrants: Matrix with the chromosomes of the immigrants
+        :param numDecoded: Number of individuals at the beginning of the population that are already decoded
+        """
+        numImmigrants = min(len(immigrants), len(self.population) - numDecoded)
+        if numImmigrants > 0:
+            self.population[len(self.population) - numImmigrants:] = immigrants[:numImmigrants]
+
+    def _startPool(self, data, maxIndividuals, chrLength, nThreads):
+        """
+        Creates the pool of processes used to decode the population. The population is passed to the processes through
+        a shared memory block instead of pickling it at every generation
+        :param data: Data defining the problem
+        :param maxIndividuals: Maximum number of individuals in the population
+        :param chrLength: Length of the chromosome of one individual
+        :param nThreads: Number of processes
+        """
+        shape = (maxIndividuals, chrLength)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, maxIndividuals * chrLength * 8))
+        self._sharedPopulation = (shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+        self._nThreads = nThreads
+        self._pool = mp.Pool(nThreads, _initWorker, (self.decode, data, shm.name, shape, mode.verbose))
+
+    def _stopPool(self):
+        """
+        Terminates the pool of processes and frees the shared memory block
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._sharedPopulation is not None:
+            (shm, _) = self._sharedPopulation
+            self._sharedPopulation = None
+            shm.close()
+            shm.unlink()
+
+    def getSolutions(self, indices, data):
+        """
+        Rebuilds the solutions of some individuals of the population
+        :param indices: Positions of the individuals in the population
+        :param data: Data defining the problem
+        :return: The solutions of the individuals
+        """
+        return self.decode(self.population[indices], data, True)[1]
+
+    def _decodeNewIndividuals(self, data, numDecoded):
+        """
+        Calculates the fitness of the individuals of the population that are not decoded yet and appends it to the one
+        of the individuals already decoded
+        :param data: Data defining the problem
+        :param numDecoded: Number of individuals at the beginning of the population that are already decoded
+        """
+        fitness = self._decodePopulation(self.population[numDecoded:], data)
+        self.fitness = np.concatenate((self.fitness[:numDecoded], fitness))
+
+    def _decodePopulation(self, population, data):
+        """
+        Calculates the fitness of a population, splitting it among the processes of the pool if there is one
+        :param population: Matrix with one chromosome per row
+        :param data: Data defining the problem
+        :return: The fitness of the population
+        """
+        if self._pool is None:
+            return self.decode(population, data, False)[0]
+
+        numIndividuals = len(population)
+        self._sharedPopulation[1][:numIndividuals] = population
+        bounds = np.linspace(0, numIndividuals, self._nThreads + 1).astype(int)
+        return np.concatenate(self._pool.map(_decodeRows, list(zip(bounds[:-1], bounds[1:]))))
+
     @staticmethod
-    def _initializePopulation(numIndividuals, chrLength):
+    def _initializePopulation(numIndividuals, chrLength, initialPopulation=None):
         """
         Initialize the population randomly
         :param numIndividuals: Number of individuals to generate
         :param chrLength: Length of the chromosome of one individual
-        :return: The generated population
+        :param initialPopulation: Matrix with chromosomes used as the first individuals instead of random ones
+        :return: The generated population. A matrix with one chromosome per row
         """
-        population = []
-        for i in range(numIndividuals):
-            chromosome = list(np.random.rand(chrLength))
-            population.append({'chr': chromosome, 'solution': {}, 'fitness': None})
+        population = np.random.rand(numIndividuals, chrLength)
+        if initialPopulation is not None and len(initialPopulation) > 0:
+            numSeeds = min(len(initialPopulation), numIndividuals)
+            population[:numSeeds] = np.asarray(initialPopulation)[:numSeeds]
         return population
 
     def _classifyIndividuals(self, numElite):
         """
-        Classifies the population between elite members and non-elite
+        Classifies the population between elite members and non-elite. Only the elite segment is sorted
         :param numElite: Number of individuals that will be considered as elite
-        :return: A tuple. The first element is the list of elite elements and the second is the list of non-elite
+        :return: A tuple. The first element is the array of indices of the elite individuals (from best to worst) and
+        the second is the array of indices of the non-elite ones
         """
-        fitness = np.array([e['fitness'] for e in self.population])
-        order = sorted(range(len(fitness)), key=lambda k: fitness[k])
-        whichElite = order[0:numElite]
-        whichNonElite = order[numElite:(len(fitness))]
-        population = np.array(self.population)
-        elite = population[whichElite]
-        nonElite = population[whichNonElite]
-        return list(elite), list(nonElite)
+        numElite = min(numElite, len(self.fitness))
+        if numElite == len(self.fitness):
+            return np.argsort(self.fitness, kind='stable'), np.empty(0, dtype=int)
+
+        order = np.argpartition(self.fitness, numElite - 1) if numElite > 0 else np.arange(len(self.fitness))
+        whichElite = order[:numElite]
+        whichElite = whichElite[np.argsort(self.fitness[whichElite], kind='stable')]
+        whichNonElite = order[numElite:]
+        return whichElite, whichNonElite
 
     @staticmethod
     def _generateMutantIndividuals(numMutants, chrLength):
@@ -101,38 +281,34 @@ class Brkga:
         Generates some mutant elements
         :param numMutants: Number of mutants to generate
         :param chrLength: Length of the chromosome of one individual
-        :return: The mutants generated
+        :return: The mutants generated. A matrix with one chromosome per row
         """
-        mutants = []
-        for i in range(numMutants):
-            chromosome = list(np.random.rand(chrLength))
-            mutants.append({'chr': chromosome, 'solution': {}, 'fitness': None})
-        return mutants
+        return np.random.rand(numMutants, chrLength)
 
     @staticmethod
     def _doCrossover(elite, nonelite, ro, numCrossover):
         """
         Do the crossover to create a new generation
-        :param elite: Elite individuals
-        :param nonelite: Non-elite individuals
+        :param elite: Matrix with the chromosomes of the elite individuals
+        :param nonelite: Matrix with the chromosomes of the non-elite individuals
         :param ro: Probability of inheriting from an elite element
         :param numCrossover: Number of new elements generated using crossover
-        :return: The crossover elements generated
+        :return: The crossover elements generated. A matrix with one chromosome per row
         """
-        crossover = []
-        for i in range(numCrossover):
-            indexElite = int(math.floor(np.random.rand() * len(elite)))
-            indexNonElite = int(math.floor(np.random.rand() * len(nonelite)))
-            chrElite = elite[indexElite]['chr']
-            chrNonElite = nonelite[indexNonElite]['chr']
-            rnd = list(np.random.rand(len(chrElite)))
-            chrCross = [chrElite[i] if rnd[i] <= ro else chrNonElite[i] for i in range(len(chrElite))]
-            crossover.append({'chr': chrCross, 'solution': {}, 'fitness': None})
-        return crossover
+        chrLength = elite.shape[1]
+        if numCrossover == 0 or len(elite) == 0:
+            return np.empty((0, chrLength))
+        # without non-elite individuals the elite ones are crossed among themselves
+        if len(nonelite) == 0:
+            nonelite = elite
+
+        indexElite = np.random.randint(0, len(elite), numCrossover)
+        indexNonElite = np.random.randint(0, len(nonelite), numCrossover)
+        inheritFromElite = np.random.rand(numCrossover, chrLength) <= ro
+        return np.where(inheritFromElite, elite[indexElite], nonelite[indexNonElite])
 
-    def _getBestFitness(self):
+    def _getBestIndex(self):
         """
-        :return: The best individual in the population
+        :return: The index of the best individual in the population
         """
-        bestFit = min(self.population, key=lambda x: x['fitness'])
-        return bestFit
+        return int(np.argmin(self.fitness))
@@ -2,12 +2,65 @@ import sys
 import os
 import time
 import math
+import random as rnd
 import multiprocessing as mp
-from functools import partial
+import numpy as np
 from otherScripts.utils import *
+from otherScripts.checkpoint import *
 
 
-def grasp(problem, maxIter=10, alfa=0.1, timeLimit=math.inf, maxItWithoutImpr=30):
+class ElitePool:
+    """
+    Pool with the best solutions found, all of them different. The problem must have the method 'distance'
+    """
+    def __init__(self, problem, size):
+        """
+        :param problem: An object representing an instance of a problem with the method 'distance'
+        :param size: Maximum number of solutions in the pool
+        """
+        self.problem = problem
+        self.size = size
+        self.solutions = []
+
+    def add(self, sol, cost):
+        """
+        Adds a solution to the pool if it's different from all the solutions in the pool and there is space or it's
+        better than the worst one, which is replaced
+        :return: True if the solution has been added
+        """
+        if self.size <= 0 or any(self.problem.distance(sol, eliteSol) == 0 for (eliteSol, _) in self.solutions):
+            return False
+        if len(self.solutions) < self.size:
+            self.solutions.append((sol, cost))
+            return True
+        idxWorst = max(range(len(self.solutions)), key=lambda i: self.solutions[i][1])
+        if cost < self.solutions[idxWorst][1]:
+            self.solutions[idxWorst] = (sol, cost)
+            return True
+        return False
+
+    def getRandom(self):
+        """
+        :return: A random solution of the pool
+        """
+        return self.solutions[rnd.randint(0, len(self.solutions) - 1)][0]
+
+    def relink(self, sol, cost):
+        """
+        Applies path relinking between a solution and a random solution of the pool and adds the result to the pool.
+        The problem must have the method 'pathRelinking'
+        :return: The best solution among the given one and the relinked one, and its cost
+        """
+        if len(self.solutions) > 0:
+            (relinkedSol, relinkedCost) = self.problem.pathRelinking(sol, self.getRandom())
+            if relinkedCost < cost:
+                (sol, cost) = (relinkedSol, relinkedCost)
+        self.add(sol, cost)
+        return sol, cost
+
+
+def grasp(problem, maxIter=10, alfa=0.1, timeLimit=math.inf, maxItWithoutImpr=30, checkpointFile=None,
+          checkpointInterval=5, lowerBound=-math.inf, elitePoolSize=0):
     """
     General GRASP algorithm
     :param problem: An object representing an instance of a problem with the methods 'construct' and 'localSearch'
@@ -15,15 +68,37 @@ def grasp(problem, maxIter=10, alfa=0.1, timeLimit=math.inf, maxItWithoutImpr=30
     :param alfa: Control of the randomnes. 0 no random, 1 total random
     :param timeLimit: Maximum amount of time to do the computations
     :param maxItWithoutImpr: Maximum number of iterations without finding an improvement
+    :param checkpointFile: File where the state of the algorithm is periodically saved. If it exists when the
+    algorithm starts, the execution is resumed from it. It's removed when the execution finishes
+    :param checkpointInterval: Minimum number of seconds between two checkpoints
+    :param lowerBound: Lower bound of the cost. The algorithm stops when it finds a solution with this cost
+    :param elitePoolSize: Size of the pool of elite solutions used for path relinking (0 means no path relinking)
     :return: The best solution and the best cost
     """
-    initTime = time.time()
-    bestSol = None
-    bestCost = math.inf
-    itWithoutImpr = 0
-    for i in range(maxIter):
+    elitePool = ElitePool(problem, elitePoolSize)
+    checkpoint = loadCheckpoint(checkpointFile)
+    if checkpoint is None:
+        initTime = time.time()
+        bestSol = None
+        bestCost = math.inf
+        itWithoutImpr = 0
+        firstIter = 0
+    else:
+        initTime = time.time() - float(checkpoint['elapsedTime'])
+        bestCost = float(checkpoint['bestCost'])
+        bestSol = checkpoint['bestSol'].tolist() if bestCost < math.inf else None
+        bestCost = int(bestCost) if bestCost < math.inf else bestCost
+        itWithoutImpr = int(checkpoint['itWithoutImpr'])
+        firstIter = int(checkpoint['iteration'])
+        setRandomState(checkpoint)
+        eprint("Process:", os.getpid(), "Resuming from iteration", firstIter)
+    lastCheckpoint = time.time()
+
+    for i in range(firstIter, maxIter):
         (sol, cost) = problem.construct(alfa)
         (sol, cost) = problem.localSearch(sol)
+        if elitePoolSize > 0:
+            (sol, cost) = elitePool.relink(sol, cost)
         eprint("Process:", os.getpid(), "Iteration:", i, "| Best cost:", bestCost)
         if cost < bestCost:
             bestSol = sol
@@ -32,27 +107,140 @@ def grasp(problem, maxIter=10, alfa=0.1, timeLimit=math.inf, maxItWithoutImpr=30
         else:
             itWithoutImpr += 1
 
-        if time.time() - initTime > timeLimit or itWithoutImpr > maxItWithoutImpr:
+        if checkpointFile is not None and time.time() - lastCheckpoint >= checkpointInterval:
+            saveCheckpoint(checkpointFile, bestSol=np.array(bestSol if bestSol is not None else []),
+                           bestCost=bestCost, itWithoutImpr=itWithoutImpr, iteration=i + 1,
+                           elapsedTime=time.time() - initTime, **getRandomState())
+            lastCheckpoint = time.time()
+
+        if time.time() - initTime > timeLimit or itWithoutImpr > maxItWithoutImpr or bestCost <= lowerBound:
             break
 
+    removeCheckpoint(checkpointFile)
+    return bestCost, bestSol
+
+
+# State of a process of parallelGrasp. The problem is received once, when the process is created, and the counters and
+# the best cost are shared with the other processes
+_worker = {}
+
+
+def _initWorker(problem, shared, verbose):
+    """
+    Initializes a process of parallelGrasp
+    :param problem: An object representing an instance of a problem with the methods 'construct' and 'localSearch'
+    :param shared: Dictionary with the lock and the values shared by all the processes
+    :param verbose: If the process has to print its messages
+    """
+    if not verbose:
+        disableVervose()
+    _worker['problem'] = problem
+    _worker['shared'] = shared
+
+
+def _parallelGraspWorker(seed, maxIter, alfa, timeLimit, maxItWithoutImpr, checkpointFile, checkpointInterval,
+                         lowerBound, elitePoolSize):
+    """
+    Executes GRASP iterations until the stopping criteria, shared by all the processes, are met. The parameters are the
+    ones of parallelGrasp, plus the seed of the random generators of the process
+    :return: The best solution and the best cost found by this process
+    """
+    problem = _worker['problem']
+    shared = _worker['shared']
+    elitePool = ElitePool(problem, elitePoolSize)
+    rnd.seed(seed)
+    np.random.seed(seed)
+
+    checkpoint = loadCheckpoint(checkpointFile)
+    if checkpoint is None:
+        bestSol = None
+        bestCost = math.inf
+    else:
+        bestCost = float(checkpoint['bestCost'])
+        bestSol = checkpoint['bestSol'].tolist() if bestCost < math.inf else None
+        bestCost = int(bestCost) if bestCost < math.inf else bestCost
+        setRandomState(checkpoint)
+    lastCheckpoint = time.time()
+
+    while True:
+        # take the next iteration, unless the stopping criteria are met
+        with shared['lock']:
+            if shared['nextIter'].value >= maxIter or shared['itWithoutImpr'].value > maxItWithoutImpr or \
+                    time.time() - shared['initTime'].value > timeLimit or shared['bestCost'].value <= lowerBound:
+                break
+            i = shared['nextIter'].value
+            shared['nextIter'].value += 1
+
+        (sol, cost) = problem.construct(alfa)
+        (sol, cost) = problem.localSearch(sol)
+        if elitePoolSize > 0:
+            (sol, cost) = elitePool.relink(sol, cost)
+
+        with shared['lock']:
+            if cost < shared['bestCost'].value:
+                shared['bestCost'].value = cost
+                shared['itWithoutImpr'].value = 0
+            else:
+                shared['itWithoutImpr'].value += 1
+            eprint("Process:", os.getpid(), "Iteration:", i, "| Best cost:", shared['bestCost'].value)
+            (nextIter, itWithoutImpr) = (shared['nextIter'].value, shared['itWithoutImpr'].value)
+
+        if cost < bestCost:
+            bestSol = sol
+            bestCost = cost
+
+        if checkpointFile is not None and time.time() - lastCheckpoint >= checkpointInterval:
+            saveCheckpoint(checkpointFile, bestSol=np.array(bestSol if bestSol is not None else []),
+                           bestCost=bestCost, itWithoutImpr=itWithoutImpr, iteration=nextIter,
+                           elapsedTime=time.time() - shared['initTime'].value, **getRandomState())
+            lastCheckpoint = time.time()
+
     return bestCost, bestSol
 
 
-def parallelGrasp(problem, maxIter=10, alfa=0.1, nThreads=mp.cpu_count(), timeLimit=math.inf, maxItWithoutImpr=30):
+def parallelGrasp(problem, maxIter=10, alfa=0.1, nThreads=mp.cpu_count(), timeLimit=math.inf, maxItWithoutImpr=30,
+                  checkpointFile=None, checkpointInterval=5, lowerBound=-math.inf, elitePoolSize=0):
     """
-    Parallel version of the GRASP algorithm
+    Parallel version of the GRASP algorithm. The processes take the iterations one by one from a shared counter and
+    share the best cost, so the stopping criteria are the same as in the sequential version
     :param problem: An object representing an instance of a problem with the methods 'construct' and 'localSearch'
     :param maxIter: Maximum number of iterations
     :param alfa: Control of the randomnes. 0 no random, 1 total random
     :param nThreads: Number of threads
     :param timeLimit: Maximum amount of time to do the computations
     :param maxItWithoutImpr: Maximum number of iterations without finding an improvement
+    :param checkpointFile: Prefix of the files where the processes periodically save their state
+    :param checkpointInterval: Minimum number of seconds between two checkpoints
+    :param lowerBound: Lower bound of the cost. The algorithm stops when it finds a solution with this cost
+    :param elitePoolSize: Size of the pool of elite solutions of each process used for path relinking (0 means no path
+    relinking)
     :return: The best solution and the best cost
     """
-    with mp.Pool(nThreads) as pool:
-        if not mode.verbose:
-            pool.map(disableVervose, [0.5]*nThreads)
-        listResults = pool.map(partial(grasp, maxIter=1 + maxIter//nThreads, alfa=alfa, timeLimit=timeLimit,
-                                       maxItWithoutImpr=maxItWithoutImpr), [problem]*nThreads)
-        bestResult = min(listResults)
-        return bestResult
+    listCheckpointFiles = [None if checkpointFile is None else checkpointFile + "_process" + str(k)
+                           for k in range(nThreads)]
+
+    # resume the shared state from the most advanced checkpoint
+    checkpoints = [c for c in map(loadCheckpoint, listCheckpointFiles) if c is not None]
+    lastCheckpoint = max(checkpoints, key=lambda c: int(c['iteration']), default=None)
+    shared = {'lock': mp.Lock(),
+              'nextIter': mp.Value('l', 0 if lastCheckpoint is None else int(lastCheckpoint['iteration']), lock=False),
+              'itWithoutImpr': mp.Value('l', 0 if lastCheckpoint is None else int(lastCheckpoint['itWithoutImpr']),
+                                        lock=False),
+              'bestCost': mp.Value('d', min((float(c['bestCost']) for c in checkpoints), default=math.inf),
+                                   lock=False),
+              'initTime': mp.Value('d', time.time() - max((float(c['elapsedTime']) for c in checkpoints), default=0),
+                                   lock=False)}
+    if lastCheckpoint is not None:
+        eprint("Resuming from iteration", shared['nextIter'].value)
+
+    seeds = [rnd.randint(0, 2 ** 31 - 1) for _ in range(nThreads)]
+    with mp.Pool(nThreads, _initWorker, (problem, shared, mode.verbose)) as pool:
+        listResults = pool.starmap(_parallelGraspWorker, [(seeds[k], maxIter, alfa, timeLimit, maxItWithoutImpr,
+                                                           listCheckpointFiles[k], checkpointInterval, lowerBound,
+                                                           elitePoolSize)
+                                                          for k in range(nThreads)])
+
+    for fileName in listCheckpointFiles:
+        removeCheckpoint(fileName)
+    bestResult = min(listResults, key=lambda result: result[0])
+    return bestResult
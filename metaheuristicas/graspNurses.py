@@ -1,7 +1,9 @@
-import copy
+import math
 import random as rnd
-import itertools as ittl
-import otherScripts.checkingFunctions as check
+from collections import Counter
+import numpy as np
+from otherScripts.nurseSchedule import NurseSchedule, matrixToMasks
+from metaheuristicas import patternsNurses
 
 
 class GraspNurses:
@@ -11,151 +13,184 @@ class GraspNurses:
         self.maxHours = maxHours
         self.maxConsec = maxConsec
         self.maxPresence = maxPresence
-        self.feasibleNurses = self._generateAllNurses()
+        patterns = patternsNurses.getPatterns(minHours, maxHours, maxConsec, maxPresence)
+        self.placements = patternsNurses.getPlacements(patterns, len(demand))
+        self.placementMasks = matrixToMasks(self.placements).tolist()
 
-    def _recursiveGenerateAllNurses(self, nurse, currentHour, nHours):
+    def toSchedule(self, nurses):
         """
-        Auxiliar function to generate all the feasible working days
-        :param nurse: The nurse being generated
-        :param currentHour: The current hour
-        :param nHours: Remaining number of working hours to assign
-        :return: The nurses generated
+        :param nurses: A list with the bitmask of each nurse, as given by construct and localSearch
+        :return: The NurseSchedule of the nurses, with one row per distinct working day
         """
-        constrMaxConsec = check.getConsecHours([nurse])[0] <= self.maxConsec
+        return NurseSchedule(nurses, len(self.demand)).compress()
 
-        if not constrMaxConsec:
-            return []
-
-        elif nHours == 0:
-            return [nurse]
-
-        else:
-            nurses = []
-            for hour in range(currentHour, min(currentHour + 2, len(nurse) - nHours + 1)):
-                auxNurse = copy.copy(nurse)
-                auxNurse[hour] = 1
-                nurses += self._recursiveGenerateAllNurses(auxNurse, hour + 1, nHours - 1)
-            return nurses
+    @staticmethod
+    def _getSummary(nurse):
+        """
+        Summary of a nurse used to check the constraints incrementally
+        :param nurse: A bitmask. The bit i is 1 if the nurse works at time i
+        :return: A list with the number of worked hours, the first working hour and the last working hour
+        """
+        if nurse == 0:
+            return [0, None, None]
+        return [bin(nurse).count("1"), (nurse & -nurse).bit_length() - 1, nurse.bit_length() - 1]
 
-    def _generateAllNurses(self):
+    def _canTakeHour(self, nurse, summary, h):
         """
-        Generates all the feasible working days (from the starting hour to the end one)
-        :return: A matrix of feasible working days
+        Checks if a nurse that satisfies all the constraints still satisfies them after working at the hour h
+        :param nurse: The bitmask of the nurse. She doesn't work at the hour h
+        :param summary: Summary of the nurse given by _getSummary
+        :param h: The hour
+        :return: True if the nurse can work at the hour h
         """
-        nurses = []
-        for nHours in range(self.minHours, self.maxHours+1):
-            nurse = [1] + [0] * (self.maxPresence - 1)
-            nurses += self._recursiveGenerateAllNurses(nurse, 1, nHours - 1)
+        (hours, first, last) = summary
+        # check minHours and maxHours
+        if not self.minHours <= hours + 1 <= self.maxHours:
+            return False
+        if hours == 0:
+            return self.maxConsec >= 1 and self.maxPresence >= 1
 
-        # drop the 0s at the end
-        nurses = [list(ittl.dropwhile(lambda x: x == 0, reversed(nurse))) for nurse in nurses]
-        return nurses
+        # check maxPresence
+        if max(last, h) - min(first, h) + 1 > self.maxPresence:
+            return False
+        # check resting hours. Only the hours before the first one or after the last one can create a longer rest
+        if first - h > 2 or h - last > 2:
+            return False
+        # check maxConsec. The new hour joins the groups of consecutive hours before and after it
+        after = nurse >> (h + 1)
+        consecAfter = (after ^ (after + 1)).bit_length() - 1
+        freeBefore = ~nurse & ((1 << h) - 1)
+        consecBefore = h - freeBefore.bit_length()
+        return consecBefore + 1 + consecAfter <= self.maxConsec
 
-    def _checkConstraints(self, nurse):
+    @staticmethod
+    def _takeHour(nurse, summary, h):
         """
-        Check if the nurse satisfies all the constraints
+        Makes a nurse work at the hour h and updates its summary
+        :return: The new bitmask of the nurse
         """
-        # check maxHours
-        constrMinMaxHours = self.minHours <= check.getNursesHours([nurse])[0] <= self.maxHours
-        # check maxPresence
-        constrMaxPresence = check.getPresenceHours([nurse])[0] <= self.maxPresence
-        # check maxConsec
-        constrMaxConsec = check.getConsecHours([nurse])[0] <= self.maxConsec
-        # check resting hours
-        constrRestHours = check.getRestingHours([nurse])[0] <= 1
+        summary[0] += 1
+        summary[1] = h if summary[1] is None else min(summary[1], h)
+        summary[2] = h if summary[2] is None else max(summary[2], h)
+        return nurse | (1 << h)
 
-        return constrMinMaxHours and constrMaxPresence and constrMaxConsec and constrRestHours
+    def _greedyCost(self, demand):
+        """
+        Calculates the greedy cost of every placement of a feasible working day, that is, the demand it leaves
+        uncovered
+        :param demand: Demand of nurses
+        :return: A vector with the greedy cost of each row of self.placements
+        """
+        return demand.sum() - self.placements @ demand
 
-    @staticmethod
-    def _greedyCostNurse(feasibleNurses, demand, nElems=100, nPos=5):
+    def _getNumCopies(self, idxElem, greedyCost, demand, alfa):
         """
-        Calculates the greedy cost of a random nurse in some random starting points
-        :param feasibleNurses: Set of feasible working days
+        Gets how many copies of a placement can be added at once. While the demand of all the hours of the placement is
+        not covered, adding a copy decreases the greedy cost of every placement by the hours of the copy it doesn't
+        share, so the greedy costs after j copies are linear in j. A copy is added only if the placement would still be
+        in the RCL
+        :param idxElem: Index of the placement in self.placements
+        :param greedyCost: Greedy cost of every placement
         :param demand: Demand of nurses
-        :param nElems: Number of nurses to extract from feasibleNurses
-        :param nPos: Number of different starting points to try
-        :return: A list of the different greedy costs calculated
-        """
-        listGreedyCost = []
-        for _ in range(nElems):
-            idx = rnd.randint(0, len(feasibleNurses) - 1)
-            auxNurse = feasibleNurses[idx]
-            for _ in range(nPos):
-                pos = rnd.randint(0, len(demand) - len(auxNurse))
-                # Create nurse. It's a deep copy of the nurse selected from feasibleNurses
-                nurse = [0] * pos + auxNurse + [0] * (len(demand) - pos - len(auxNurse))
-                greedyCost = sum((demand[i] * (1 - nurse[i]) for i in range(len(demand))))
-                listGreedyCost.append((greedyCost, nurse))
-
-        return listGreedyCost
+        :param alfa: Parameter to control the randomness
+        :return: The number of copies
+        """
+        placement = self.placements[idxElem].astype(np.int64)
+        maxCopies = int(demand[placement == 1].min())
+        if maxCopies <= 1:
+            return 1
+
+        decrease = placement.sum() - self.placements @ placement
+
+        def inRCL(copies):
+            cost = greedyCost - copies * decrease
+            minCost = cost.min()
+            return greedyCost[idxElem] <= minCost + alfa * (cost.max() - minCost)
+
+        # the RCL threshold doesn't increase with the number of copies
+        (low, high) = (1, maxCopies)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if inRCL(mid - 1):
+                low = mid
+            else:
+                high = mid - 1
+        return low
 
     def construct(self, alfa=0.1):
         """
-        Construct a solution for the problem using a randomized greedy constructive algorithm
+        Construct a solution for the problem using a randomized greedy constructive algorithm. Each chosen placement
+        is added as many times as the residual demand allows while it stays in the RCL
         :param alfa: Parameter to control the randomness
-        :return: The solution and its cost
+        :return: The solution, a list with the bitmask of each nurse, and its cost
         """
         nurses = []
-        auxDemand = copy.copy(self.demand)
+        auxDemand = np.array(self.demand, dtype=np.int64)
 
         # We don't have a solution until all the demand is satisfied
-        while sum(auxDemand) > 0:
-            listGreedyCost = self._greedyCostNurse(self.feasibleNurses, auxDemand)
-            minCost = min(listGreedyCost)[0]
-            maxCost = max(listGreedyCost)[0]
-            RCL = [elem[1] for elem in listGreedyCost if elem[0] <= minCost + alfa*(maxCost - minCost)]
-            randomElem = RCL[rnd.randint(0, len(RCL)-1)]
-            nurses.append(randomElem)
-            auxDemand = [max(0, auxDemand[i] - randomElem[i]) for i in range(len(auxDemand))]
+        while auxDemand.sum() > 0:
+            greedyCost = self._greedyCost(auxDemand)
+            minCost = greedyCost.min()
+            maxCost = greedyCost.max()
+            RCL = np.flatnonzero(greedyCost <= minCost + alfa*(maxCost - minCost))
+            idxElem = RCL[rnd.randint(0, len(RCL)-1)]
+            copies = self._getNumCopies(idxElem, greedyCost, auxDemand, alfa)
+            nurses += [self.placementMasks[idxElem]] * copies
+            auxDemand = np.maximum(0, auxDemand - copies * self.placements[idxElem].astype(np.int64))
 
         nNurses = len(nurses)
         return nurses, nNurses
 
-    def _getListFreeNurses(self, nurses):
+    def _getListFreeNurses(self, nurses, summaries):
         """
-        Gives a list of sets of nurses that can work for each hour
+        Gives a list of sets of nurses that can work for each hour. The hours are checked once per distinct working day
         """
-        freeNurses = [set() for _ in range(len(nurses[0]))]
+        freeNurses = [set() for _ in range(len(self.demand))]
+        freeHours = {}
         for (i, nurse) in enumerate(nurses):
-            for (h, work) in enumerate(nurse):
-                if not work:
-                    nurse[h] = 1
-                    if self._checkConstraints(nurse):
-                        freeNurses[h].add(i)
-                    nurse[h] = 0
+            if nurse not in freeHours:
+                freeHours[nurse] = [h for h in range(len(self.demand))
+                                    if not (nurse >> h) & 1 and self._canTakeHour(nurse, summaries[i], h)]
+            for h in freeHours[nurse]:
+                freeNurses[h].add(i)
         return freeNurses
 
     def localSearch(self, nurses):
         """
         Applies local search to nurses in order to improve the cost of the solution. It tries to eliminate
         every nurse without violating any constraint
+        :param nurses: A list with the bitmask of each nurse. It's modified
+        :return: The solution and its cost
         """
-        offerNurses = check.getOffer(nurses)
-        extraNurses = [offerNurses[i] - self.demand[i] for i in range(len(self.demand))]
-        freeNurses = self._getListFreeNurses(nurses)
+        offerNurses = self.toSchedule(nurses).getOffer()
+        extraNurses = [int(offerNurses[i]) - self.demand[i] for i in range(len(self.demand))]
+        summaries = [self._getSummary(nurse) for nurse in nurses]
+        freeNurses = self._getListFreeNurses(nurses, summaries)
+
+        # working days that couldn't be eliminated since the last elimination. The identical nurses are not tried again
+        notEliminated = set()
 
         # try to eliminate every nurse
-        for (i, nurse) in enumerate(nurses):
-            if nurse is None:
+        for i in range(len(nurses)):
+            nurse = nurses[i]
+            if nurse is None or nurse in notEliminated:
                 continue
 
             dictSubstitutes = {}
             canEliminate = True
 
             # for all hours from a nurse
-            for (h, work) in enumerate(nurse):
-                if work == 0 or extraNurses[h] > 0:
+            for h in range(len(self.demand)):
+                if not (nurse >> h) & 1 or extraNurses[h] > 0:
                     continue
 
                 # try to assign the hours to other nurses
                 for idNurse in freeNurses[h]:
                     otherNurse = nurses[idNurse]
-                    otherNurse[h] = 1
-                    if self._checkConstraints(otherNurse):
+                    if self._canTakeHour(otherNurse, summaries[idNurse], h):
+                        nurses[idNurse] = self._takeHour(otherNurse, summaries[idNurse], h)
                         dictSubstitutes[h] = idNurse
                         break
-                    else:
-                        otherNurse[h] = 0
 
                 # we couldn't find a substitute for the j-th hour
                 if h not in dictSubstitutes:
@@ -171,17 +206,56 @@ class GraspNurses:
                         setNurses.remove(i)
 
                 # update extraNurses
-                for (h, work) in enumerate(nurse):
+                for h in range(len(self.demand)):
                     # if the hour has been eliminated, not swapped with another nurse
                     if h not in dictSubstitutes:
-                        extraNurses[h] = extraNurses[h] - work
+                        extraNurses[h] = extraNurses[h] - ((nurse >> h) & 1)
                 # "delete" nurse
                 nurses[i] = None
+                notEliminated.clear()
 
             else:
+                notEliminated.add(nurse)
                 # reset values for modified nurses
                 for (hour, idNurse) in dictSubstitutes.items():
-                    nurses[idNurse][hour] = 0
+                    nurses[idNurse] &= ~(1 << hour)
+                for idNurse in set(dictSubstitutes.values()):
+                    summaries[idNurse] = self._getSummary(nurses[idNurse])
 
         nurses = list(filter(lambda row: row is not None, nurses))
         return nurses, len(nurses)
+
+    @staticmethod
+    def distance(nursesA, nursesB):
+        """
+        Distance between two solutions: the number of working days of one solution that are not in the other one
+        """
+        diffAB = Counter(nursesA) - Counter(nursesB)
+        diffBA = Counter(nursesB) - Counter(nursesA)
+        return max(sum(diffAB.values()), sum(diffBA.values()))
+
+    def pathRelinking(self, initial, guiding, nSteps=5):
+        """
+        Moves the initial solution towards the guiding one. At each step, some working days of the guiding solution
+        are added to the initial solution and the local search eliminates the nurses it can, trying first with the
+        nurses that are not in the guiding solution
+        :param initial: Initial solution
+        :param guiding: Guiding solution
+        :param nSteps: Number of intermediate solutions evaluated
+        :return: The best intermediate solution and its cost
+        """
+        common = Counter(initial) & Counter(guiding)
+        toRemove = list((Counter(initial) - common).elements())
+        toAdd = sorted((Counter(guiding) - common).elements(), key=lambda nurse: nurse & -nurse)
+        common = list(common.elements())
+
+        bestSol = None
+        bestCost = math.inf
+        stepSize = max(1, int(math.ceil(len(toAdd) / nSteps)))
+        for k in range(stepSize, len(toAdd) + stepSize, stepSize):
+            nurses = toRemove + common + toAdd[:k]
+            (sol, cost) = self.localSearch(nurses)
+            if cost < bestCost:
+                bestSol = sol
+                bestCost = cost
+        return bestSol, bestCost
@@ -0,0 +1,110 @@
+import queue
+import random
+import numpy as np
+import multiprocessing as mp
+from functools import partial
+from metaheuristicas.generalBrkga import Brkga
+from otherScripts.utils import *
+
+
+def getNeighbours(topology, nIslands):
+    """
+    Gets the islands that receive the migrants of each island
+    :param topology: 'ring' (each island sends to the next one) or 'full' (each island sends to all the others)
+    :param nIslands: Number of islands
+    :return: A list. The ith position has the list of islands that receive the migrants of the ith island
+    """
+    if topology == 'ring':
+        return [[(k + 1) % nIslands] if nIslands > 1 else [] for k in range(nIslands)]
+    elif topology == 'full':
+        return [[j for j in range(nIslands) if j != k] for k in range(nIslands)]
+    else:
+        raise ValueError("Unsupported topology " + str(topology))
+
+
+def _exchange(elite, numMigrants, inbox, outboxes):
+    """
+    Sends the best chromosomes of an island to its neighbours and collects the ones other islands have sent to it
+    :param elite: Elite chromosomes of the island (from best to worst)
+    :param numMigrants: Number of chromosomes sent to each neighbour
+    :param inbox: Queue where the other islands put the chromosomes for this island
+    :param outboxes: Queues of the neighbours
+    :return: A matrix with the chromosomes received
+    """
+    migrants = np.array(elite[:numMigrants])
+    for outbox in outboxes:
+        outbox.put(migrants)
+
+    immigrants = [np.empty((0, elite.shape[1]))]
+    while True:
+        try:
+            immigrants.append(inbox.get_nowait())
+        except queue.Empty:
+            break
+    return np.vstack(immigrants)
+
+
+def _runIsland(idIsland, seed, verbose, decode, data, chrLength, brkgaArgs, migrationInterval, numMigrants, inboxes,
+               neighbours, results):
+    """
+    Evolves the population of one island and puts its best individual in results
+    """
+    if not verbose:
+        disableVervose()
+    np.random.seed(seed)
+    random.seed(seed)
+    # The neighbours may have finished, so the migrants that are never received must not block the exit
+    for idNeighbour in neighbours:
+        inboxes[idNeighbour].cancel_join_thread()
+
+    # Every island keeps its own checkpoint
+    if brkgaArgs.get('checkpointFile') is not None:
+        brkgaArgs = dict(brkgaArgs, checkpointFile=brkgaArgs['checkpointFile'] + "_island" + str(idIsland))
+
+    solver = Brkga(decode)
+    exchange = partial(_exchange, numMigrants=numMigrants, inbox=inboxes[idIsland],
+                       outboxes=[inboxes[idNeighbour] for idNeighbour in neighbours])
+    (cost, solution) = solver.run(data, chrLength, migrationInterval=migrationInterval, exchange=exchange, **brkgaArgs)
+    results.put((solver.fitness.min(), cost, idIsland, solution))
+
+
+def islandBrkga(decode, data, chrLength, nIslands=4, migrationInterval=10, numMigrants=2, topology='ring',
+                **brkgaArgs):
+    """
+    Island model of the BRKGA algorithm. Every island is an independent population that evolves in its own process and
+    periodically sends its best chromosomes to its neighbours
+    :param decode: Decoder for the problem
+    :param data: Data defining the problem. It's a dictionary of parameters.
+    :param chrLength: Length of the chromosome for an individual
+    :param nIslands: Number of islands
+    :param migrationInterval: Number of generations between two migrations
+    :param numMigrants: Number of chromosomes an island sends to each neighbour at every migration
+    :param topology: Which islands receive the migrants of each island ('ring' or 'full')
+    :param brkgaArgs: Parameters of Brkga.run for every island (numIndividuals, maxGenerations, timeLimit...)
+    :return: The cost and the solution of the best individual found among all the islands
+    """
+    neighbours = getNeighbours(topology, nIslands)
+    inboxes = [mp.Queue() for _ in range(nIslands)]
+    results = mp.Queue()
+    seeds = np.random.randint(0, 2 ** 31 - 1, nIslands)
+
+    islands = [mp.Process(target=_runIsland,
+                          args=(k, int(seeds[k]), mode.verbose, decode, data, chrLength, brkgaArgs, migrationInterval,
+                                numMigrants, inboxes, neighbours[k], results))
+               for k in range(nIslands)]
+    for island in islands:
+        island.start()
+
+    listResults = []
+    while len(listResults) < nIslands:
+        try:
+            listResults.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(island.is_alive() for island in islands) and results.empty():
+                raise RuntimeError("An island finished without giving its result")
+    for island in islands:
+        island.join()
+
+    (bestFitness, bestCost, idIsland, bestSolution) = min(listResults, key=lambda res: res[:3])
+    eprint("Best island:", idIsland, "| Fitness", bestFitness)
+    return bestCost, bestSolution
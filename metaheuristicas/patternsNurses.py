@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+
+# Folder where the tables of feasible working days are cached
+cacheFolder = "./cache/patterns/"
+
+
+def enumeratePatterns(minHours, maxHours, maxConsec, maxPresence):
+    """
+    Enumerates all the feasible working days (from the starting hour to the end one). A working day starts with a
+    working hour, never rests two consecutive hours and satisfies minHours, maxHours, maxConsec and maxPresence
+    :return: A list of bitmasks. The bit i of a bitmask is 1 if the nurse works at the ith hour of the working day
+    """
+    patterns = []
+    if maxConsec < 1:
+        return patterns
+
+    for nHours in range(max(1, minHours), min(maxHours, maxPresence) + 1):
+        # Depth-first search. A state is (bitmask, next free hour, remaining hours, current consecutive hours)
+        stack = [(1, 1, nHours - 1, 1)]
+        while stack:
+            (mask, currentHour, remainingHours, consecHours) = stack.pop()
+            if remainingHours == 0:
+                patterns.append(mask)
+                continue
+            # The next working hour is the current one or, after resting one hour, the next one. The states are pushed
+            # in reverse order to explore the current hour first
+            for hour in reversed(range(currentHour, min(currentHour + 2, maxPresence - remainingHours + 1))):
+                consec = consecHours + 1 if hour == currentHour else 1
+                if consec <= maxConsec:
+                    stack.append((mask | (1 << hour), hour + 1, remainingHours - 1, consec))
+    return patterns
+
+
+def getPatterns(minHours, maxHours, maxConsec, maxPresence, useCache=True):
+    """
+    Gets the table of feasible working days for some constraints. The table is cached in cacheFolder, so instances
+    that share the constraints don't enumerate the working days again
+    :param useCache: If the cache has to be used
+    :return: A matrix (uint8) with one working day per row, padded with 0s until maxPresence hours
+    """
+    fileName = os.path.join(cacheFolder, "patterns_" + "_".join(str(int(x)) for x in
+                                                               (minHours, maxHours, maxConsec, maxPresence)) + ".npy")
+    if useCache and os.path.exists(fileName):
+        return np.load(fileName)
+
+    masks = enumeratePatterns(minHours, maxHours, maxConsec, maxPresence)
+    width = max(0, maxPresence)
+    patterns = np.array([[(mask >> h) & 1 for h in range(width)] for mask in masks], dtype=np.uint8)
+    patterns = patterns.reshape(len(masks), width)
+
+    if useCache:
+        os.makedirs(cacheFolder, exist_ok=True)
+        tmpName = fileName + "." + str(os.getpid()) + ".tmp"
+        with open(tmpName, 'wb') as f:
+            np.save(f, patterns)
+        os.replace(tmpName, fileName)
+    return patterns
+
+
+def getPatternLengths(patterns):
+    """
+    :param patterns: Table of feasible working days given by getPatterns
+    :return: A vector with the number of hours from the first working hour to the last one of each working day
+    """
+    if patterns.size == 0:
+        return np.zeros(len(patterns), dtype=int)
+    return patterns.shape[1] - np.argmax(patterns[:, ::-1], axis=1)
+
+
+def getPlacements(patterns, hoursDay):
+    """
+    Places every feasible working day at every possible starting hour
+    :param patterns: Table of feasible working days given by getPatterns
+    :param hoursDay: Number of hours in a day
+    :return: A matrix (uint8) with one row for each pair (working day, starting hour), ordered by working day and then
+    by starting hour
+    """
+    lengths = getPatternLengths(patterns)
+    width = min(patterns.shape[1], hoursDay)
+    idPattern = []
+    rows = []
+    for pos in range(hoursDay):
+        fits = np.flatnonzero(lengths + pos <= hoursDay)
+        placed = np.zeros((len(fits), hoursDay), dtype=np.uint8)
+        placed[:, pos:pos + width] = patterns[fits, :min(width, hoursDay - pos)]
+        idPattern.append(fits)
+        rows.append(placed)
+    idPattern = np.concatenate(idPattern)
+    rows = np.concatenate(rows)
+    # stable sort by working day keeps the starting hours in increasing order
+    return rows[np.argsort(idPattern, kind='stable')]
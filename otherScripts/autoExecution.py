@@ -2,8 +2,24 @@ import os
 import time
 import subprocess
 import math
+import tempfile
+import multiprocessing as mp
+import multiprocessing.connection
+import signal
+from functools import partial
 from otherScripts.checkingFunctions import *
-from metaheuristicas import generalGrasp, graspNurses, generalBrkga, decoderNurses
+from otherScripts import lowerBounds
+from otherScripts.nurseSchedule import NurseSchedule
+from otherScripts.instance import loadInstance, parseDat, getInstanceKey
+from otherScripts.instanceStore import InstanceStore, exportDat
+from otherScripts.results import ResultWriter, encodeSchedule, readResults, getSolvedInstances
+from metaheuristicas import generalGrasp, graspNurses, generalBrkga, decoderNurses, islandBrkga
+
+try:
+    import resource
+except ImportError:
+    # not available in Windows. The memory of the workers of the batch mode is not limited
+    resource = None
 
 
 class bcolors:
@@ -20,34 +36,6 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
-def getParams(fileDat):
-    """
-    Exctracts the params from a .dat file and builds a dictionary
-    :param fileDat: .dat file
-    :return: A dictionary of the used params and the cost and if it is feasible (writen in comments in the .dat file)
-    """
-    with open(fileDat, mode='r') as f:
-        d = {"solution": "UNKNOWN", "cost": math.inf}
-        for line in f:
-            line = line.replace("\n", "")
-            line = line.replace(" = ", "=")
-            if "=" in line:
-                ll = line.split("=")
-                name = ll[0]
-                if "[" in ll[1]:
-                    value = [int(number) for number in ll[1][1:-2].split(" ")]
-                else:
-                    value = int(ll[1][:-1])
-                d[name] = value
-            elif "INFEASIBLE" in line:
-                d["solution"] = "INFEASIBLE"
-            elif "FEASIBLE" in line:
-                d["solution"] = "FEASIBLE"
-            elif "COST" in line:
-                d["cost"] = int(line.split()[-1])
-    return d
-
-
 def getSolution(strSolution):
     """
     From the output string of the oplrun.exe, it extracts the solution (if exists)
@@ -66,7 +54,32 @@ def getSolution(strSolution):
         return retVal
 
 
-def executeOpl(pathToDat, maxTime, solverParams):
+def getCheckpointFile(instanceName, solverName, solverParams):
+    """
+    Gets the file used to save the checkpoints of a solver for an instance
+    :param instanceName: Name of the instance
+    :param solverName: Name of the solver
+    :param solverParams: Parameters of the solver. The checkpoints are saved in solverParams['checkpointFolder']
+    :return: The path of the checkpoint file or None if the checkpoints are disabled
+    """
+    checkpointFolder = solverParams.get('checkpointFolder')
+    if checkpointFolder is None:
+        return None
+    return os.path.join(checkpointFolder, os.path.basename(instanceName) + "_" + solverName + ".ckpt")
+
+
+def executeOpl(instance, maxTime, solverParams, timings=None):
+    # the instances that don't come from a .dat file are exported to a temporary one
+    if instance.path is None:
+        (fd, pathToDat) = tempfile.mkstemp(suffix=".dat", dir=".")
+        os.close(fd)
+        exportDat(instance, pathToDat)
+        try:
+            return executeOpl(loadInstance(pathToDat, useCache=False), maxTime, solverParams, timings)
+        finally:
+            os.remove(pathToDat)
+
+    pathToDat = instance.path
     pathToOPL = solverParams['pathToOPL']
     pathToMod = solverParams['pathToMod']
     configName = "ConfigForPython"
@@ -97,43 +110,92 @@ def executeOpl(pathToDat, maxTime, solverParams):
   </category>
 </settings>""")
 
+    t = time.time()
     try:
         result = subprocess.check_output(pathToOPL + ' -v -p "." ' + configName, shell=True)
     except subprocess.CalledProcessError:
         # no solution
         return -1, []
+    finally:
+        if timings is not None:
+            timings['opl'] = time.time() - t
 
     result = result.decode("utf-8")
-    nurses = getSolution(result)
-    cost = sum(sum(nurse) > 0 for nurse in nurses)
+    nurses = NurseSchedule.fromMatrix(getSolution(result))
+    cost = nurses.getNumWorkingNurses()
     return cost, nurses
 
 
-def executeGrasp(pathToDat, maxTime, solverParams):
-    params = getParams(pathToDat)
+def executeGrasp(instance, maxTime, solverParams, timings=None):
+    params = instance
+    timings = {} if timings is None else timings
 
     if analyseFeasability(params) != "INFEASIBLE":
+        t = time.time()
         problem = graspNurses.GraspNurses(params['demand'], params['minHours'], params['maxHours'], params['maxConsec'],
                                           params['maxPresence'])
         numIter = solverParams['numIter']
         alfa = solverParams['alfa']
         nThreads = solverParams['nThreads']
         maxItWithoutImpr = solverParams['maxItWithoutImpr']
+        checkpointFile = getCheckpointFile(instance.name, "grasp", solverParams)
+        checkpointInterval = solverParams.get('checkpointInterval', 5)
+        elitePoolSize = solverParams.get('elitePoolSize', 0)
+        lowerBound = lowerBounds.getLowerBound(params, problem.placements)
+        timings['setup'] = time.time() - t
+        # there aren't enough nurses to cover the demand
+        if lowerBound > params['nNurses']:
+            return -1, []
 
-        (cost, sol) = generalGrasp.parallelGrasp(problem, numIter, alfa, nThreads, maxTime, maxItWithoutImpr)
+        t = time.time()
+        (cost, sol) = generalGrasp.parallelGrasp(problem, numIter, alfa, nThreads, maxTime, maxItWithoutImpr,
+                                                 checkpointFile, checkpointInterval, lowerBound, elitePoolSize)
+        timings['search'] = time.time() - t
     else:
         return -1, []
 
     if -1 < cost <= params['nNurses']:
-        return cost, sol
+        return cost, problem.toSchedule(sol)
     else:
         return -1, []
 
 
-def executeBrkga(pathToDat, maxTime, solverParams):
-    params = getParams(pathToDat)
+def getWarmStartPopulation(params, numSolutions, alfa=0.1):
+    """
+    Builds chromosomes for the initial population of the BRKGA from GRASP solutions
+    :param params: Parameters of the instance
+    :param numSolutions: Number of GRASP solutions to encode
+    :param alfa: Control of the randomness of the GRASP constructive algorithm
+    :return: A matrix with one chromosome per row, or None if numSolutions is 0
+    """
+    if numSolutions == 0:
+        return None
+    # stops the program if the encoder doesn't give back the solutions of the decoder
+    assert isEncoderOk(params)
+    problem = graspNurses.GraspNurses(params['demand'], params['minHours'], params['maxHours'], params['maxConsec'],
+                                      params['maxPresence'])
+    population = []
+    for _ in range(numSolutions):
+        (sol, cost) = problem.construct(alfa)
+        (sol, cost) = problem.localSearch(sol)
+        population.append(decoderNurses.encode(problem.toSchedule(sol).toMatrix(), params))
+    return population
+
+
+def executeBrkga(instance, maxTime, solverParams, timings=None):
+    params = instance
+    timings = {} if timings is None else timings
+
+    t = time.time()
+    lowerBound = lowerBounds.getLowerBound(params) if analyseFeasability(params) != "INFEASIBLE" else math.inf
+    timings['bound'] = time.time() - t
+    # there aren't enough nurses to cover the demand
+    if lowerBound <= params['nNurses']:
+        initTime = time.time()
+        initialPopulation = getWarmStartPopulation(params, solverParams.get('warmStart', 0))
+        timings['warmStart'] = time.time() - initTime
+        maxTime -= timings['warmStart']
 
-    if analyseFeasability(params) != "INFEASIBLE":
         chrLen = decoderNurses.getChrLength(params)
         numIndividuals = solverParams['numIndividuals']
         maxGenerations = solverParams['maxGenerations']
@@ -141,10 +203,31 @@ def executeBrkga(pathToDat, maxTime, solverParams):
         mutantsProp = solverParams['mutantsProp']
         inheritanceProp = solverParams['inheritanceProb']
         maxItWithoutImpr = solverParams['maxItWithoutImpr']
+        nThreads = solverParams['nThreads']
+        nIslands = solverParams['nIslands']
+        checkpointFile = getCheckpointFile(instance.name, "brkga", solverParams)
+        checkpointInterval = solverParams.get('checkpointInterval', 5)
+        isOptimal = partial(lowerBounds.reachesLowerBound, params=params, lowerBound=lowerBound)
 
-        solver = generalBrkga.Brkga(decoderNurses.decode)
-        (cost, solution) = solver.run(params, chrLen, numIndividuals, maxGenerations, eliteProp,
-                                      mutantsProp, inheritanceProp, maxTime, maxItWithoutImpr)
+        t = time.time()
+        if nIslands > 1:
+            (cost, solution) = islandBrkga.islandBrkga(decoderNurses.decode, params, chrLen, nIslands,
+                                                       solverParams['migrationInterval'], solverParams['numMigrants'],
+                                                       solverParams['topology'], numIndividuals=numIndividuals,
+                                                       maxGenerations=maxGenerations, eliteProp=eliteProp,
+                                                       mutantsProp=mutantsProp, inheritanceProb=inheritanceProp,
+                                                       timeLimit=maxTime, maxItWithoutImpr=maxItWithoutImpr,
+                                                       nThreads=max(1, nThreads // nIslands),
+                                                       checkpointFile=checkpointFile,
+                                                       checkpointInterval=checkpointInterval,
+                                                       initialPopulation=initialPopulation, isOptimal=isOptimal)
+        else:
+            solver = generalBrkga.Brkga(decoderNurses.decode)
+            (cost, solution) = solver.run(params, chrLen, numIndividuals, maxGenerations, eliteProp,
+                                          mutantsProp, inheritanceProp, maxTime, maxItWithoutImpr, nThreads,
+                                          checkpointFile=checkpointFile, checkpointInterval=checkpointInterval,
+                                          initialPopulation=initialPopulation, isOptimal=isOptimal)
+        timings['search'] = time.time() - t
     else:
         return -1, []
 
@@ -154,42 +237,230 @@ def executeBrkga(pathToDat, maxTime, solverParams):
         return -1, []
 
 
-def executeSolver(datFolder, solver, maxTime, solverParams, fileName=None):
+def getInstances(source, skip=()):
+    """
+    Gets the instances of a folder with .dat files or of an instance store
+    :param source: Folder with .dat files or file of an InstanceStore
+    :param skip: Pairs (name, key given by instance.getInstanceKey) of the instances that are not loaded
+    :return: The number of instances, an iterator that loads them one by one and the number of instances skipped
+    """
+    if os.path.isfile(source):
+        store = InstanceStore(source)
+        records = store.getRecords()
+        listIdx = [i for (i, record) in enumerate(records)
+                   if len(skip) == 0 or (record["name"].decode(), getInstanceKey(record)) not in skip]
+        return len(listIdx), (store[i] for i in listIdx), len(records) - len(listIdx)
+
+    listDat = list(filter(lambda f: len(f) > 5 and f[-4:] == ".dat", os.listdir(source)))
+    nFiles = len(listDat)
+    if len(skip) > 0:
+        listDat = [f for f in listDat if (f, getInstanceKey(parseDat(os.path.join(source, f)))) not in skip]
+    listDat.sort(key=lambda f: len(f))
+    return len(listDat), (loadInstance(os.path.join(source, file)) for file in listDat), nFiles - len(listDat)
+
+
+def _solveInstance(solver, params, maxTime, solverParams, timings):
+    """
+    Solves an instance
+    :return: The cost, the solution and the time consumed
+    """
+    t = time.time()
+    (cost, sol) = solver(params, maxTime, solverParams, timings)
+    return cost, sol, time.time() - t
+
+
+def runSequential(instances, solver, maxTime, solverParams):
+    """
+    Solves the instances one after another in this process
+    :param instances: Iterator over the instances
+    :return: An iterator over the instance, cost, solution, time, timings and status ("ok") of each instance
+    """
+    instances = iter(instances)
+    while True:
+        t = time.time()
+        params = next(instances, None)
+        if params is None:
+            return
+        timings = {'load': time.time() - t}
+        (cost, sol, t) = _solveInstance(solver, params, maxTime, solverParams, timings)
+        yield params, cost, sol, t, timings, "ok"
+
+
+# Signals that stop a batch execution. Its workers are in their own process groups, so they don't receive them
+_stopSignals = [signal.SIGINT, signal.SIGTERM]
+
+
+def _batchWorker(conn, solver, params, maxTime, solverParams, maxMemory):
+    """
+    Solves an instance in a worker of the batch mode and sends the cost, the solution, the time, the timings and the
+    status through conn
+    """
+    # own process group, so the processes of the solver are also killed when the time limit is exceeded
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # the handlers of runBatch are inherited, but they only make sense in the main process
+    for signum in _stopSignals:
+        signal.signal(signum, signal.SIG_DFL if signum != signal.SIGINT else signal.default_int_handler)
+    if maxMemory is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (maxMemory * 2**20, maxMemory * 2**20))
+
+    timings = {}
+    t = time.time()
+    try:
+        result = _solveInstance(solver, params, maxTime, solverParams, timings) + (timings, "ok")
+    except MemoryError:
+        result = (-1, [], time.time() - t, timings, "memory")
+    conn.send(result)
+    conn.close()
+
+
+def _killWorker(process):
+    """
+    Kills a worker of the batch mode and all the processes of its process group
+    """
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.terminate()
+    process.join()
+
+
+def runBatch(instances, solver, maxTime, solverParams, batchParams):
+    """
+    Solves several instances at the same time, each one in its own process. A worker that exceeds the time limit of the
+    solver by more than batchParams['timeMargin'] seconds is killed and the memory of each worker can be limited to
+    batchParams['maxMemory'] MB (not in Windows). The solvers still use their own processes (nThreads in solverParams)
+    :param instances: Iterator over the instances
+    :param batchParams: Dictionary with nWorkers, timeMargin and maxMemory (None for no limit)
+    :return: An iterator over the instance, cost, solution, time, timings and status ("ok", "timeout", "memory" or
+    "error") of each instance, in the order of instances
+    """
+    nWorkers = batchParams['nWorkers']
+    timeLimit = maxTime + batchParams['timeMargin']
+    maxMemory = batchParams.get('maxMemory')
+    instances = enumerate(instances)
+    running = {}
+    finished = {}
+    nextIdx = 0
+    exhausted = False
+
+    # the workers are killed before the signals that stop this process are handled as usual
+    previousHandlers = {signum: signal.getsignal(signum) for signum in _stopSignals}
+
+    def killWorkersAndStop(signum, frame):
+        for (process, _, _, _, _) in list(running.values()):
+            _killWorker(process)
+        signal.signal(signum, previousHandlers[signum])
+        os.kill(os.getpid(), signum)
+
+    for signum in _stopSignals:
+        signal.signal(signum, killWorkersAndStop)
+
+    try:
+        while not exhausted or len(running) > 0:
+            # start new workers
+            while not exhausted and len(running) < nWorkers:
+                t = time.time()
+                item = next(instances, None)
+                if item is None:
+                    exhausted = True
+                    break
+                (idx, params) = item
+                loadTime = time.time() - t
+                (recvConn, sendConn) = mp.Pipe(duplex=False)
+                process = mp.Process(target=_batchWorker,
+                                     args=(sendConn, solver, params, maxTime, solverParams, maxMemory))
+                process.start()
+                sendConn.close()
+                running[idx] = (process, recvConn, params, time.time(), loadTime)
+
+            ready = mp.connection.wait([elem[1] for elem in running.values()], timeout=1)
+            for idx in list(running.keys()):
+                (process, conn, params, startTime, loadTime) = running[idx]
+                if conn in ready:
+                    try:
+                        result = conn.recv()
+                        process.join()
+                    except EOFError:
+                        # the worker died without sending the result
+                        process.join()
+                        result = (-1, [], time.time() - startTime, {}, "error")
+                elif time.time() - startTime > timeLimit:
+                    _killWorker(process)
+                    result = (-1, [], time.time() - startTime, {}, "timeout")
+                else:
+                    continue
+                conn.close()
+                del running[idx]
+                result[3]['load'] = loadTime
+                finished[idx] = (params,) + result
+
+            # the results are given in the order of the instances
+            while nextIdx in finished:
+                yield finished.pop(nextIdx)
+                nextIdx += 1
+    finally:
+        for (process, conn, _, _, _) in running.values():
+            _killWorker(process)
+            conn.close()
+        for (signum, handler) in previousHandlers.items():
+            signal.signal(signum, handler)
+
+
+def executeSolver(datFolder, solver, maxTime, solverParams, fileName=None, batchParams=None):
     """
     Executes all the files in the datFolder and prints the time consumed, the cost and checks several constraints in
-    order to be sure the opl program works correctly
-    :param datFolder: Folder with the .dat files
+    order to be sure the opl program works correctly. The results are written as they are obtained, one JSON record
+    per instance (see results.py), so the file of an interrupted execution keeps the instances already solved. If the
+    results file already exists, the instances (same name and params) solved with the same solver, params and time
+    limit are skipped and the new results are appended
+    :param datFolder: Folder with the .dat files or file of an InstanceStore
     :param solver:
     :param maxTime:
     :param solverParams:
     :param fileName:
+    :param batchParams: Params of the batch mode (see runBatch). If it's None or it has less than 2 workers, the
+    instances are solved one after another
     """
     writeResults = fileName is not None
+    solved = set()
     if writeResults:
         fileName = fileName + '_' + solver.__name__
-        costAndTimeFile = open(fileName + "_costTime.csv", 'w')
-        costAndTimeFile.write("dat_file, cost, time \n")
-        nursesFile = open(fileName + "_nurses.txt", 'w')
+        solved = getSolvedInstances(readResults(fileName + ".jsonl"), solver.__name__, solverParams, maxTime)
+        newCsv = not os.path.exists(fileName + "_costTime.csv")
+        costAndTimeFile = open(fileName + "_costTime.csv", 'a')
+        if newCsv:
+            costAndTimeFile.write("dat_file, cost, time \n")
+        resultWriter = ResultWriter(fileName + ".jsonl", append=True)
 
-    listDat = list(filter(lambda f: len(f) > 5 and f[-4:] == ".dat", os.listdir(datFolder)))
-    listDat.sort(key=lambda f: len(f))
-    for (i, file) in enumerate(listDat[:1]):
-        print(bcolors.BOLD + str(i+1) + "/" + str(len(listDat)) + " (" + solver.__name__ + ")" + bcolors.ENDC)
-        print(bcolors.BOLD + "Executing", file, bcolors.ENDC)
-        pathToDat = datFolder + file
+    (nInstances, instances, nSkipped) = getInstances(datFolder, solved)
+    if nSkipped > 0:
+        print(bcolors.BOLD + "Skipping", nSkipped, "instances already solved" + bcolors.ENDC)
+    if batchParams is not None and batchParams['nWorkers'] > 1:
+        results = runBatch(instances, solver, maxTime, solverParams, batchParams)
+    else:
+        results = runSequential(instances, solver, maxTime, solverParams)
 
-        t = time.time()
-        (cost, sol) = solver(pathToDat, maxTime, solverParams)
-        t = time.time() - t
+    for (i, (params, cost, sol, t, timings, status)) in enumerate(results):
+        file = params.name
+        print(bcolors.BOLD + str(i+1) + "/" + str(nInstances) + " (" + solver.__name__ + ")" + bcolors.ENDC)
+        print(bcolors.BOLD + "Executing", file, bcolors.ENDC)
         print("Time:", round(t, 2), "s")
+        if status != "ok":
+            print(bcolors.WARNING + "worker stopped: " + status + bcolors.ENDC)
 
-        params = getParams(pathToDat)
+        tCheck = time.time()
+        lowerBound = params.get("lowerBound", math.inf)
+        satConstr = (None, None)
         # no solution
         if cost == -1:
             print(bcolors.UNDERLINE + "no solution" + bcolors.ENDC)
             print("should be:", params["solution"])
             shouldBeInfeasible = params["solution"] != "FEASIBLE"
-            if shouldBeInfeasible:
+            if shouldBeInfeasible and status == "ok":
                 print(bcolors.OKGREEN + "OK" + bcolors.ENDC)
             else:
                 print(bcolors.FAIL + "FAIL" + bcolors.ENDC)
@@ -197,8 +468,10 @@ def executeSolver(datFolder, solver, maxTime, solverParams, fileName=None):
         # solution feasible
         else:
             satConstr = answerSatisfiesConstr(sol, params)
+            lowerBound = lowerBounds.getLowerBound(params)
             print(bcolors.UNDERLINE + "solution found" + bcolors.ENDC)
             print("cost:", cost)
+            print("lower bound:", lowerBound, "(optimal)" if cost <= lowerBound else "")
             costOk = cost <= params["cost"]
             print("cost ok:", costOk)
             print("constrains satisfied:", satConstr[1])
@@ -208,15 +481,20 @@ def executeSolver(datFolder, solver, maxTime, solverParams, fileName=None):
                 print(bcolors.OKGREEN + "OK" + bcolors.ENDC)
             else:
                 print(bcolors.FAIL + "FAIL" + bcolors.ENDC)
+        timings['check'] = time.time() - tCheck
         print()
 
         if writeResults:
             costAndTimeFile.write(file + ", " + str(cost) + ", " + str(t) + "\n")
-            nursesFile.write(file + '\n')
-            for nurse in sol:
-                nursesFile.write(str(nurse) + '\n')
-            nursesFile.write('\n')
+            costAndTimeFile.flush()
+            source = os.path.abspath(params.path if params.path is not None else datFolder)
+            resultWriter.write({"instance": file, "instanceKey": getInstanceKey(params), "source": source,
+                                "solver": solver.__name__, "solverParams": solverParams,
+                                "maxTime": maxTime, "status": status, "cost": cost, "time": t,
+                                "lowerBound": lowerBound, "optimal": cost != -1 and cost <= lowerBound,
+                                "expectedSolution": params["solution"], "expectedCost": params["cost"],
+                                "constraints": satConstr[1], "timings": timings, "schedule": encodeSchedule(sol)})
 
     if writeResults:
         costAndTimeFile.close()
-        nursesFile.close()
+        resultWriter.close()
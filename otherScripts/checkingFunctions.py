@@ -1,5 +1,89 @@
 import math
-import itertools as ittl
+import numpy as np
+from otherScripts.nurseSchedule import NurseSchedule
+from metaheuristicas import decoderNurses
+
+
+def toMatrix(nurses, hoursDay=None):
+    """
+    Converts a solution to a matrix of uint8
+    :param nurses: A matrix or a NurseSchedule. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param hoursDay: Number of hours of a day. Only needed when there are no nurses
+    :return: A numpy array with shape (nNurses, hoursDay)
+    """
+    if isinstance(nurses, NurseSchedule):
+        matrix = nurses.toMatrix()
+    else:
+        matrix = np.asarray(nurses, dtype=np.uint8)
+    if matrix.size == 0:
+        matrix = matrix.reshape(0, 0 if hoursDay is None else hoursDay)
+    return matrix
+
+
+def toSchedule(nurses, hoursDay=None):
+    """
+    Converts a solution to a NurseSchedule
+    :param nurses: A matrix or a NurseSchedule. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param hoursDay: Number of hours of a day. Only needed when there are no nurses
+    :return: The NurseSchedule, with one row per row of the matrix
+    """
+    if isinstance(nurses, NurseSchedule):
+        return nurses
+    return NurseSchedule.fromMatrix(nurses, hoursDay)
+
+
+def toRows(nurses, hoursDay=None):
+    """
+    Converts a solution to its distinct working days, without repeating the identical ones of a NurseSchedule
+    :param nurses: A matrix or a NurseSchedule. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param hoursDay: Number of hours of a day. Only needed when there are no nurses
+    :return: A numpy array with shape (nRows, hoursDay) and a vector with the number of nurses of each row
+    """
+    if isinstance(nurses, NurseSchedule):
+        (matrix, counts) = nurses.getRows()
+    else:
+        matrix = np.asarray(nurses, dtype=np.uint8)
+        counts = np.ones(len(matrix), dtype=np.int64)
+    if matrix.size == 0:
+        matrix = matrix.reshape(0, 0 if hoursDay is None else hoursDay)
+    return matrix, counts
+
+
+def _getRunLengths(matrix):
+    """
+    For each cell of a boolean matrix, gets the length of the run of ones of its row that ends in it
+    :param matrix: A numpy array with shape (nRows, nCols)
+    :return: A numpy array with shape (nRows, nCols). The cell (i, j) is 0 if matrix[i, j] is 0, or the number of
+    consecutive ones of the row i ending at j
+    """
+    cumOnes = np.cumsum(matrix, axis=1, dtype=np.int32)
+    lastReset = np.maximum.accumulate(np.where(matrix == 0, cumOnes, 0), axis=1)
+    return cumOnes - lastReset
+
+
+def _getPresenceLimits(matrix):
+    """
+    For each nurse, gets the first and the last hour she works
+    :param matrix: A numpy array with shape (nNurses, hoursDay)
+    :return: Two numpy arrays with the first and the last hour. They are meaningless for the nurses that don't work
+    """
+    hoursDay = matrix.shape[1]
+    if hoursDay == 0:
+        return np.zeros(len(matrix), dtype=int), np.zeros(len(matrix), dtype=int)
+    first = np.argmax(matrix, axis=1)
+    last = hoursDay - 1 - np.argmax(matrix[:, ::-1], axis=1)
+    return first, last
+
+
+def _getRestingMatrix(matrix):
+    """
+    :param matrix: A numpy array with shape (nNurses, hoursDay)
+    :return: A boolean numpy array with the resting hours of each nurse, i.e. the hours she doesn't work between her
+    first and her last working hour. The nurses that don't work have no resting hours
+    """
+    (first, last) = _getPresenceLimits(matrix)
+    hours = np.arange(matrix.shape[1])
+    return (matrix == 0) & (hours >= first[:, None]) & (hours <= last[:, None]) & matrix.any(axis=1)[:, None]
 
 
 def getNursesHours(nurses):
@@ -8,7 +92,7 @@ def getNursesHours(nurses):
     :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
     :return: A list. The ith position have the number of hours the ith nurse works
     """
-    return [sum(nurse) for nurse in nurses]
+    return toMatrix(nurses).sum(axis=1, dtype=int).tolist()
 
 
 def getOffer(nurses):
@@ -17,7 +101,7 @@ def getOffer(nurses):
     :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
     :return: A list. The ith position have the number of nurses that work in the ith hour
     """
-    return [sum(col) for col in zip(*nurses)]
+    return toMatrix(nurses).sum(axis=0, dtype=int).tolist()
 
 
 def getPresenceHours(nurses):
@@ -26,9 +110,9 @@ def getPresenceHours(nurses):
     :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
     :return: A list. The ith position have the number of hours the ith nurse spends at the hospital
     """
-    nursesWithoutBegin = [list(ittl.dropwhile(lambda x: x == 0, nurse)) for nurse in nurses]
-    nursesWithoutBeginAndEnd = [list(ittl.dropwhile(lambda x: x == 0, reversed(nurse))) for nurse in nursesWithoutBegin]
-    return [len(nurse) for nurse in nursesWithoutBeginAndEnd]
+    matrix = toMatrix(nurses)
+    (first, last) = _getPresenceLimits(matrix)
+    return np.where(matrix.any(axis=1), last - first + 1, 0).tolist()
 
 
 def getConsecHours(nurses):
@@ -37,38 +121,8 @@ def getConsecHours(nurses):
     :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
     :return: A list. The ith position have the maximum number of consecutive hours the ith nurse works
     """
-    nursesConsec = []
-    for nurse in nurses:
-        auxNurse = nurse
-        maxConsecHours = 0
-        while len(auxNurse) > 0:
-            auxNurse = list(ittl.dropwhile(lambda x: x == 0, auxNurse))
-            consecHours = len(list(ittl.takewhile(lambda x: x == 1, auxNurse)))
-            maxConsecHours = max(maxConsecHours, consecHours)
-            auxNurse = list(ittl.dropwhile(lambda x: x == 1, auxNurse))
-        nursesConsec.append(maxConsecHours)
-    return nursesConsec
-
-
-def getRestingHours(nurses):
-    """
-    For each nurse, gets the maximum number of resting hours
-    :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
-    :return: A list. The ith position have the maximum number of resting hours for the ith nurse
-    """
-    nursesResting = []
-    for nurse in nurses:
-        maxRestingHours = 0
-        # eliminate begin and tail
-        auxNurse = list(ittl.dropwhile(lambda x: x == 0, nurse))
-        auxNurse = list(ittl.dropwhile(lambda x: x == 0, reversed(auxNurse)))
-        while len(auxNurse) > 0:
-            auxNurse = list(ittl.dropwhile(lambda x: x == 1, auxNurse))
-            consecRestHours = len(list(ittl.takewhile(lambda x: x == 0, auxNurse)))
-            maxRestingHours = max(maxRestingHours, consecRestHours)
-            auxNurse = list(ittl.dropwhile(lambda x: x == 0, auxNurse))
-        nursesResting.append(maxRestingHours)
-    return nursesResting
+    matrix = toMatrix(nurses)
+    return _getRunLengths(matrix).max(axis=1, initial=0).tolist()
 
 
 def analyseFeasability(params):
@@ -102,7 +156,7 @@ def analyseFeasability(params):
 def isFeasibleGeneratorOk(nurses, params):
     """
     Checks if a feasible generator gives a correct instance
-    :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param nurses: A matrix or a NurseSchedule. The cell (i, j) is 1 if nurse "i" works at time "j"
     :param params: Parameters of the problem
     :return: True if it is correct, otherwise False
     """
@@ -111,49 +165,72 @@ def isFeasibleGeneratorOk(nurses, params):
     return satConstr and feasibility != "INFEASIBLE"
 
 
-def answerSatisfiesConstr(nurses, params):
+def isEncoderOk(params, numIndividuals=10):
+    """
+    Checks that the encoder of the BRKGA inverts its decoder: the solutions of random chromosomes, once encoded, are
+    decoded as the same solutions
+    :param params: Parameters of the problem (with an even number of hours in a day)
+    :param numIndividuals: Number of random chromosomes checked
+    :return: True if it is correct, otherwise False
+    """
+    population = np.random.rand(numIndividuals, decoderNurses.getChrLength(params))
+    solutions = decoderNurses.decode(population, params)[1]
+    encoded = [decoderNurses.encode(nurses.toMatrix(), params) for nurses in solutions]
+    decoded = decoderNurses.decode(np.array(encoded), params)[1]
+    return all(sorted(nursesA.toList()) == sorted(nursesB.toList()) for (nursesA, nursesB) in zip(solutions, decoded))
+
+
+def answerSatisfiesConstr(nurses, params, withViolations=False):
     """
     Checks if the answer satisfies all the constrains
-    :param nurses: Matrix (nRows = nNurses, nCols = nHours) representing the answer to the problem
+    :param nurses: Matrix (nRows = nNurses, nCols = nHours) or NurseSchedule representing the answer to the problem
     :param params: Params of an instance of the problem
-    :return: True if the answer satisfy all the constraints
+    :param withViolations: If it also has to return where each constraint is violated
+    :return: True if the answer satisfy all the constraints, a dictionary with the result of each constraint and, if
+    withViolations is True, a dictionary with the violations of each constraint. For constrNNurses, constrMinMaxHours
+    and constrMaxPresence, it's an array with the nurses that violate it. For constrDemand, an array with the hours with
+    not enough nurses. For constrMaxConsec and constrRestHours, an array of pairs (nurse, hour) with the hours that
+    exceed the limit. For a NurseSchedule, the nurses are its rows, so each distinct working day is checked once
     """
     minHours = params["minHours"]
     maxHours = params["maxHours"]
     maxConsec = params["maxConsec"]
     maxPresence = params["maxPresence"]
-    demand = params["demand"]
+    demand = np.asarray(params["demand"])
     nNurses = params["nNurses"]
 
-    # check we've used less than the maximum number of nurses
-    constrNNurses = len(nurses) <= nNurses
+    nurses = toSchedule(nurses, len(demand))
+    counts = nurses.counts
 
-    # drop the nurses that don't work
-    nurses = list(filter(lambda nurse: sum(nurse) > 0, nurses))
+    # the nurses that don't work are not taken into account
+    totalNurseHours = nurses.getHours()
+    working = (totalNurseHours > 0) & (counts > 0)
 
     # check minHours and maxHours
-    totalNurseHours = getNursesHours(nurses)
-    constrMinMaxHours = all((minHours <= nHours <= maxHours for nHours in totalNurseHours))
+    violMinMaxHours = np.flatnonzero(working & ((totalNurseHours < minHours) | (totalNurseHours > maxHours)))
 
     # check satisfied demand
-    nNursesInHour = getOffer(nurses)
-    constrDemand = all((dem <= nur for (nur, dem) in zip(nNursesInHour, demand)))
+    violDemand = np.flatnonzero(nurses.getOffer() < demand)
 
     # check maxPresence
-    nursesMaxPresence = getPresenceHours(nurses)
-    constrMaxPresence = all((maxPresence >= presence for presence in nursesMaxPresence))
-
-    # check maxConsec
-    consecHours = getConsecHours(nurses)
-    constrMaxConsec = all((maxConsec >= nurseConsecHours for nurseConsecHours in consecHours))
-
-    # check resting hours
-    restingHours = getRestingHours(nurses)
-    constrRestHours = all((1 >= restHours for restHours in restingHours))
-
-    # allconstraints = [constrNNurses, constrMinMaxHours, constrDemand,
-    #                   constrMaxPresence, constrMaxConsec, constrRestHours]
-    allconstraints = {'constrNNurses': constrNNurses, 'constrMinMaxHours': constrMinMaxHours,
-                      'constrDemand': constrDemand, 'constrMaxPresence': constrMaxPresence,
-                      'constrMaxConsec': constrMaxConsec, 'constrRestHours': constrRestHours}
-    return all(allconstraints.items()), allconstraints
+    violMaxPresence = np.flatnonzero(working & (nurses.getPresenceHours() > maxPresence))
+
+    # check maxConsec and resting hours. The hours that exceed the limits are only searched if they are asked
+    violMaxConsec = np.flatnonzero(working & (nurses.getConsecHours() > maxConsec))
+    violRestHours = np.flatnonzero(working & (nurses.getRestingHours() > 1))
+    if withViolations:
+        matrix = nurses.getRows()[0]
+        violMaxConsec = np.argwhere((_getRunLengths(matrix) > maxConsec) & working[:, None])
+        violRestHours = np.argwhere((_getRunLengths(_getRestingMatrix(matrix)) > 1) & working[:, None])
+
+    # check we've used less than the maximum number of nurses
+    violNNurses = np.flatnonzero(np.cumsum(counts) > nNurses)
+
+    violations = {'constrNNurses': violNNurses, 'constrMinMaxHours': violMinMaxHours,
+                  'constrDemand': violDemand, 'constrMaxPresence': violMaxPresence,
+                  'constrMaxConsec': violMaxConsec, 'constrRestHours': violRestHours}
+    allconstraints = {name: len(viol) == 0 for (name, viol) in violations.items()}
+    if withViolations:
+        return all(allconstraints.values()), allconstraints, violations
+    else:
+        return all(allconstraints.values()), allconstraints
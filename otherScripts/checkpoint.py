@@ -0,0 +1,64 @@
+import os
+import random
+import numpy as np
+
+
+def saveCheckpoint(fileName, **arrays):
+    """
+    Writes a checkpoint in a binary file. The file is replaced atomically, so a process killed while writing never
+    leaves a broken checkpoint
+    :param fileName: File of the checkpoint
+    :param arrays: Values to store. Each one must be convertible to a numpy array
+    """
+    folder = os.path.dirname(fileName)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    tmpName = fileName + ".tmp"
+    with open(tmpName, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmpName, fileName)
+
+
+def loadCheckpoint(fileName):
+    """
+    Reads a checkpoint written by saveCheckpoint
+    :param fileName: File of the checkpoint
+    :return: A dictionary with the stored values or None if there is no checkpoint
+    """
+    if fileName is None or not os.path.exists(fileName):
+        return None
+    with np.load(fileName, allow_pickle=False) as f:
+        return {key: f[key] for key in f.files}
+
+
+def removeCheckpoint(fileName):
+    """
+    Removes a checkpoint if it exists
+    :param fileName: File of the checkpoint
+    """
+    if fileName is not None and os.path.exists(fileName):
+        os.remove(fileName)
+
+
+def getRandomState():
+    """
+    Gets the state of the random generators of the modules random and numpy.random
+    :return: A dictionary of arrays that can be stored with saveCheckpoint
+    """
+    (version, internalState, gaussNext) = random.getstate()
+    (_, keys, pos, hasGauss, cachedGaussian) = np.random.get_state()
+    return {'rndVersion': version, 'rndState': np.array(internalState, dtype=np.uint64),
+            'rndGauss': np.nan if gaussNext is None else gaussNext,
+            'npKeys': keys, 'npPos': pos, 'npHasGauss': hasGauss, 'npGauss': cachedGaussian}
+
+
+def setRandomState(state):
+    """
+    Restores the state of the random generators from the values returned by getRandomState
+    :param state: Dictionary with the state of the random generators
+    """
+    gaussNext = float(state['rndGauss'])
+    random.setstate((int(state['rndVersion']), tuple(int(x) for x in state['rndState']),
+                     None if np.isnan(gaussNext) else gaussNext))
+    np.random.set_state(('MT19937', state['npKeys'], int(state['npPos']), int(state['npHasGauss']),
+                         float(state['npGauss'])))
@@ -0,0 +1,181 @@
+import os
+import re
+import math
+import hashlib
+import numpy as np
+from otherScripts.checkingFunctions import analyseFeasability
+from otherScripts import lowerBounds
+from metaheuristicas import decoderNurses
+
+
+# Folder where the binary copies of the instances are cached
+cacheFolder = "./cache/instances/"
+# Version of the format of the cached instances. The cached instances of other versions are rebuilt
+_cacheVersion = 1
+
+# Integer params of an instance and codes of the known feasibility of an instance
+intParams = ["hoursDay", "minHours", "maxHours", "maxConsec", "maxPresence", "nNurses"]
+solutionCodes = ["UNKNOWN", "FEASIBLE", "INFEASIBLE"]
+_paramPattern = re.compile(r"^\s*(\w+)\s*=\s*(\[[^\]]*\]|-?\d+)\s*;", re.MULTILINE)
+
+
+class Instance(dict):
+    """
+    Instance of the nurses problem. It's a dictionary with the params of the instance (hoursDay, minHours, maxHours,
+    maxConsec, maxPresence, nNurses and demand), the feasibility and the cost written in the comments of its file
+    (solution and cost) and the derived data (feasibility, lowerBound and the thresholds of the decoder)
+    """
+    def __init__(self, params, path=None, name=None):
+        """
+        :param params: Dictionary with the params of the instance
+        :param path: Path to the .dat file of the instance (None if it doesn't come from a .dat file)
+        :param name: Name of the instance. By default, the name of its .dat file
+        """
+        super().__init__(params)
+        self.path = path
+        self.name = name if name is not None or path is None else os.path.basename(path)
+
+
+def parseDat(fileDat):
+    """
+    Parses a .dat file
+    :param fileDat: .dat file
+    :return: A dictionary of the used params and the cost and if it is feasible (writen in comments in the .dat file)
+    """
+    with open(fileDat, mode='r') as f:
+        text = f.read()
+
+    params = {"solution": "UNKNOWN", "cost": math.inf}
+    for (name, value) in _paramPattern.findall(text):
+        if value[0] == "[":
+            params[name] = [int(number) for number in value[1:-1].split()]
+        else:
+            params[name] = int(value)
+
+    missing = [name for name in intParams + ["demand"] if name not in params]
+    if len(missing) > 0:
+        raise ValueError(fileDat + ": missing params " + ", ".join(missing))
+    if len(params["demand"]) != params["hoursDay"]:
+        raise ValueError(fileDat + ": the demand doesn't have hoursDay values")
+
+    for line in text.splitlines():
+        if not line.startswith("//"):
+            continue
+        if "INFEASIBLE" in line:
+            params["solution"] = "INFEASIBLE"
+        elif "FEASIBLE" in line:
+            params["solution"] = "FEASIBLE"
+        elif "COST" in line:
+            params["cost"] = int(line.split()[-1])
+    return params
+
+
+def getInstanceKey(params):
+    """
+    Identifies an instance by its params, so two instances with the same name from different files can be told apart
+    :param params: Dictionary with the params of the instance or record of an InstanceStore
+    :return: A hexadecimal hash of the integer params and the demand
+    """
+    values = [int(params[name]) for name in intParams] + [int(elem) for elem in params["demand"]]
+    return hashlib.md5(" ".join(str(value) for value in values).encode()).hexdigest()
+
+
+def addDerivedData(params):
+    """
+    Computes the feasibility screening, the lower bound and the thresholds of the decoder of an instance and stores
+    them in params
+    :param params: Dictionary with the params of the instance
+    :return: params
+    """
+    params["feasibility"] = analyseFeasability(params)
+    if params["feasibility"] != "INFEASIBLE":
+        # the decoder only works for days with an even number of hours
+        if params["hoursDay"] % 2 == 0:
+            decoderNurses.getDecoderTables(params)
+        params["lowerBound"] = lowerBounds.getLowerBound(params)
+    else:
+        params["lowerBound"] = math.inf
+    return params
+
+
+def _getCacheFile(fileDat):
+    """
+    :param fileDat: .dat file
+    :return: The file where the binary copy of the instance is cached
+    """
+    absPath = os.path.abspath(fileDat)
+    key = hashlib.md5(absPath.encode()).hexdigest()[:12]
+    return os.path.join(cacheFolder, os.path.basename(fileDat) + "_" + key + ".npy")
+
+
+def _getDtype(hoursDay):
+    """
+    :param hoursDay: Number of hours in a day
+    :return: The structured dtype of a cached instance
+    """
+    half = (hoursDay + 1) // 2
+    return np.dtype([("version", "i4")] + [(name, "i4") for name in intParams] +
+                    [("demand", "i4", (hoursDay,)), ("solution", "i1"), ("cost", "f8"), ("feasibility", "i1"),
+                     ("lowerBound", "f8"), ("hasDecoderTables", "?"), ("propHalf", "f8"),
+                     ("firstHalf", "f8", (half,)), ("secondHalf", "f8", (hoursDay - half,))])
+
+
+def _toRecord(params):
+    """
+    :param params: Dictionary with the params and the derived data of an instance
+    :return: A structured array with one element
+    """
+    record = np.zeros(1, dtype=_getDtype(params["hoursDay"]))
+    record["version"] = _cacheVersion
+    for name in intParams + ["demand", "cost", "lowerBound"]:
+        record[name] = params[name]
+    record["solution"] = solutionCodes.index(params["solution"])
+    record["feasibility"] = solutionCodes.index(params["feasibility"])
+    record["hasDecoderTables"] = "propHalf" in params
+    if "propHalf" in params:
+        for name in ["propHalf", "firstHalf", "secondHalf"]:
+            record[name] = params[name]
+    return record
+
+
+def _fromRecord(record):
+    """
+    :param record: A structured array with one element
+    :return: A dictionary with the params and the derived data of the instance
+    """
+    record = record[0]
+    params = {name: int(record[name]) for name in intParams}
+    params["demand"] = record["demand"].tolist()
+    params["solution"] = solutionCodes[int(record["solution"])]
+    params["cost"] = int(record["cost"]) if record["cost"] < math.inf else math.inf
+    params["feasibility"] = solutionCodes[int(record["feasibility"])]
+    params["lowerBound"] = int(record["lowerBound"]) if record["lowerBound"] < math.inf else math.inf
+    if record["hasDecoderTables"]:
+        params["propHalf"] = float(record["propHalf"])
+        params["firstHalf"] = np.array(record["firstHalf"])
+        params["secondHalf"] = np.array(record["secondHalf"])
+    return params
+
+
+def loadInstance(fileDat, useCache=True):
+    """
+    Loads an instance from a .dat file. The parsed instance and its derived data are cached in cacheFolder as a
+    memory-mappable binary file, which is used while it's newer than the .dat file
+    :param fileDat: .dat file
+    :param useCache: If the cache has to be used
+    :return: The Instance
+    """
+    cacheFile = _getCacheFile(fileDat)
+    if useCache and os.path.exists(cacheFile) and os.path.getmtime(cacheFile) >= os.path.getmtime(fileDat):
+        record = np.load(cacheFile, mmap_mode='r')
+        if record["version"][0] == _cacheVersion:
+            return Instance(_fromRecord(record), fileDat)
+
+    params = addDerivedData(parseDat(fileDat))
+    if useCache:
+        os.makedirs(cacheFolder, exist_ok=True)
+        tmpName = cacheFile + "." + str(os.getpid()) + ".tmp"
+        with open(tmpName, 'wb') as f:
+            np.save(f, _toRecord(params))
+        os.replace(tmpName, cacheFile)
+    return Instance(params, fileDat)
@@ -0,0 +1,161 @@
+import os
+import math
+import numpy as np
+from otherScripts.instance import Instance, addDerivedData, intParams, solutionCodes
+from data_generators.generator import writeParams
+
+
+# Header of a store: an identifier, the version of the format, the number of hours of a day of all its instances and
+# the number of instances
+_magic = b"NURSESTORE"
+_version = 1
+_headerDtype = np.dtype([("magic", "S10"), ("version", "<u4"), ("hoursDay", "<u4"), ("count", "<u8")])
+_headerSize = 64
+
+
+def _getRecordDtype(hoursDay):
+    """
+    :param hoursDay: Number of hours in a day
+    :return: The structured dtype of an instance of a store
+    """
+    return np.dtype([("name", "S64")] + [(name, "<i4") for name in intParams] +
+                    [("demand", "<i4", (hoursDay,)), ("solution", "i1"), ("cost", "<f8")])
+
+
+class InstanceStore:
+    """
+    Single file with many instances of the problem with the same number of hours in a day. The file has a header and
+    one fixed-size record per instance, so it can be memory-mapped. The instances are appended at the end and the
+    number of instances of the header is updated after writing the record, so an interrupted append is ignored
+    """
+    def __init__(self, fileName, hoursDay=None):
+        """
+        Opens a store. If the file doesn't exist, it's created
+        :param fileName: File of the store
+        :param hoursDay: Number of hours in a day. Only needed to create the store
+        """
+        self.fileName = fileName
+        if not os.path.exists(fileName):
+            if hoursDay is None:
+                raise ValueError(fileName + " doesn't exist and hoursDay is not given")
+            self._writeHeader(hoursDay, 0)
+        header = np.fromfile(fileName, dtype=_headerDtype, count=1)
+        if len(header) == 0 or header["magic"][0] != _magic or header["version"][0] != _version:
+            raise ValueError(fileName + " is not an instance store")
+        self.hoursDay = int(header["hoursDay"][0])
+        if hoursDay is not None and hoursDay != self.hoursDay:
+            raise ValueError(fileName + " has instances of " + str(self.hoursDay) + " hours")
+        self.recordDtype = _getRecordDtype(self.hoursDay)
+        # memory-mapped records, reused while the number of instances doesn't change
+        self._records = None
+
+    def _writeHeader(self, hoursDay, count):
+        """
+        Writes the header of the store
+        """
+        header = np.zeros(1, dtype=_headerDtype)
+        header["magic"] = _magic
+        header["version"] = _version
+        header["hoursDay"] = hoursDay
+        header["count"] = count
+        mode = 'r+b' if os.path.exists(self.fileName) else 'wb'
+        with open(self.fileName, mode) as f:
+            f.write(header.tobytes().ljust(_headerSize, b"\0"))
+
+    def __len__(self):
+        return int(np.fromfile(self.fileName, dtype=_headerDtype, count=1)["count"][0])
+
+    def append(self, name, params, feasibility, cost=-1):
+        """
+        Appends an instance at the end of the store
+        :param name: Name of the instance (up to 64 bytes in UTF-8)
+        :param params: Params of the instance
+        :param feasibility: If it is known that exists a feasible solution for the params (FEASIBLE, INFEASIBLE or
+        anything else if it's unknown)
+        :param cost: Cost of a known solution (-1 if unknown)
+        """
+        if params["hoursDay"] != self.hoursDay:
+            raise ValueError("The store has instances of " + str(self.hoursDay) + " hours")
+        encodedName = name.encode()
+        if len(encodedName) > self.recordDtype["name"].itemsize:
+            raise ValueError("The name " + name + " is longer than " + str(self.recordDtype["name"].itemsize) +
+                             " bytes")
+        record = np.zeros(1, dtype=self.recordDtype)
+        record["name"] = encodedName
+        for key in intParams + ["demand"]:
+            record[key] = params[key]
+        record["solution"] = solutionCodes.index(feasibility) if feasibility in solutionCodes else 0
+        record["cost"] = cost if cost > 0 else math.inf
+
+        count = len(self)
+        with open(self.fileName, 'r+b') as f:
+            f.seek(_headerSize + count * self.recordDtype.itemsize)
+            f.write(record.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        self._writeHeader(self.hoursDay, count + 1)
+
+    def getRecords(self):
+        """
+        :return: A read-only memory-mapped structured array with all the instances of the store
+        """
+        count = len(self)
+        if count == 0:
+            return np.zeros(0, dtype=self.recordDtype)
+        if self._records is None or len(self._records) != count:
+            self._records = np.memmap(self.fileName, dtype=self.recordDtype, mode='r', offset=_headerSize,
+                                      shape=(count,))
+        return self._records
+
+    @staticmethod
+    def _toInstance(record, withDerivedData=True):
+        """
+        :param record: Record of an instance
+        :param withDerivedData: If the derived data of the instance (see instance.addDerivedData) has to be computed
+        :return: The Instance
+        """
+        params = {key: int(record[key]) for key in intParams}
+        params["demand"] = record["demand"].tolist()
+        params["solution"] = solutionCodes[int(record["solution"])]
+        params["cost"] = int(record["cost"]) if record["cost"] < math.inf else math.inf
+        if withDerivedData:
+            addDerivedData(params)
+        return Instance(params, name=record["name"].decode())
+
+    def getInstance(self, i, withDerivedData=True):
+        """
+        :param i: Index of the instance
+        :param withDerivedData: If the derived data of the instance (see instance.addDerivedData) has to be computed
+        :return: The Instance
+        """
+        records = self._records if self._records is not None and i < len(self._records) else self.getRecords()
+        return self._toInstance(records[i], withDerivedData)
+
+    def __getitem__(self, i):
+        return self.getInstance(i)
+
+    def __iter__(self):
+        for record in self.getRecords():
+            yield self._toInstance(record)
+
+    def exportAll(self, folder):
+        """
+        Writes all the instances of the store as .dat files in a folder
+        :param folder: Folder where the .dat files are written
+        """
+        os.makedirs(folder, exist_ok=True)
+        for record in self.getRecords():
+            instance = self._toInstance(record, withDerivedData=False)
+            exportDat(instance, os.path.join(folder, instance.name))
+
+
+def exportDat(instance, fileDat):
+    """
+    Writes an instance as a .dat file
+    :param instance: The Instance
+    :param fileDat: .dat file
+    """
+    params = {key: instance[key] for key in intParams + ["demand"]}
+    feasibility = instance["solution"] if instance["solution"] != "UNKNOWN" else "RANDOM"
+    writeParams(params, feasibility, fileDat, instance["cost"] if instance["cost"] < math.inf else -1)
@@ -0,0 +1,112 @@
+import math
+import numpy as np
+from metaheuristicas import patternsNurses
+from otherScripts.checkingFunctions import toRows
+
+
+def simpleLowerBound(params):
+    """
+    Lower bound of the number of nurses given by the maximum demand and by the total demand
+    :param params: Params of an instance of the problem
+    :return: The lower bound
+    """
+    demand = params["demand"]
+    maxHours = params["maxHours"]
+    if maxHours <= 0:
+        return max(demand, default=0)
+    return max(max(demand, default=0), int(math.ceil(sum(demand) / maxHours)))
+
+
+def lpLowerBound(demand, placements, maxIter=10000):
+    """
+    Lower bound given by the linear relaxation of the problem over all the placements of the feasible working days:
+    min sum(x) subject to placements^T x >= demand, x >= 0. It's solved with a revised simplex (there is only one
+    constraint per hour, so the basis is tiny) and the bound is computed from the dual solution y, scaled to satisfy
+    placements y <= 1. Any feasible y gives a valid bound, so the result is safe even if the simplex stops early
+    :param demand: A list representing the demand of nurses at each hour
+    :param placements: A matrix with one row for each pair (working day, starting hour)
+    :param maxIter: Maximum number of iterations of the simplex
+    :return: The lower bound (not rounded)
+    """
+    demand = np.asarray(demand, dtype=float)
+    if len(placements) == 0 or demand.sum() <= 0:
+        return 0.0
+    coverage = np.asarray(placements, dtype=float).T  # one column per placement
+    (nHours, m) = coverage.shape
+    tol = 1e-9
+
+    # Columns: placements (cost 1), surplus variables (cost 0) and artificial variables (cost bigM)
+    bigM = 10 * (demand.sum() + 1)
+    costs = np.concatenate((np.ones(m), np.zeros(nHours), np.full(nHours, bigM)))
+
+    def getColumn(j):
+        if j < m:
+            return coverage[:, j]
+        col = np.zeros(nHours)
+        col[(j - m) % nHours] = -1 if j < m + nHours else 1
+        return col
+
+    # The initial basis is formed by the artificial variables
+    basis = list(range(m + nHours, m + 2 * nHours))
+    matB = np.eye(nHours)
+    y = np.zeros(nHours)
+    numDegenerate = 0
+    for _ in range(maxIter):
+        xB = np.linalg.solve(matB, demand)
+        y = np.linalg.solve(matB.T, costs[basis])
+        reducedCosts = costs - np.concatenate((y @ coverage, -y, y))
+        # Dantzig's rule, or Bland's rule to avoid cycling after many degenerate pivots
+        candidates = np.flatnonzero(reducedCosts < -tol)
+        if len(candidates) == 0:
+            break
+        entering = candidates[0] if numDegenerate > 50 else candidates[np.argmin(reducedCosts[candidates])]
+
+        direction = np.linalg.solve(matB, getColumn(entering))
+        rows = np.flatnonzero(direction > tol)
+        if len(rows) == 0:
+            break
+        ratios = xB[rows] / direction[rows]
+        leaving = rows[np.flatnonzero(ratios <= ratios.min() + tol)]
+        leaving = leaving[np.argmin(np.array(basis)[leaving])]
+        numDegenerate = numDegenerate + 1 if ratios.min() <= tol else 0
+
+        basis[leaving] = entering
+        matB[:, leaving] = getColumn(entering)
+
+    # scale the dual solution to make it feasible
+    y = np.maximum(y, 0)
+    maxCoverage = max(1.0, (y @ coverage).max())
+    return float(demand @ y / maxCoverage)
+
+
+def getLowerBound(params, placements=None):
+    """
+    Lower bound of the number of nurses needed for an instance of the problem. It's the best of the simple bounds and
+    the bound given by the linear relaxation over the placements of the feasible working days
+    :param params: Params of an instance of the problem
+    :param placements: Matrix with one row for each pair (working day, starting hour). If it's None it's generated
+    :return: The lower bound. If params already has it (see instance.loadInstance), it isn't computed again
+    """
+    if "lowerBound" in params:
+        return params["lowerBound"]
+    bound = simpleLowerBound(params)
+    if placements is None:
+        patterns = patternsNurses.getPatterns(params["minHours"], params["maxHours"], params["maxConsec"],
+                                              params["maxPresence"])
+        placements = patternsNurses.getPlacements(patterns, len(params["demand"]))
+    # a tiny tolerance avoids rounding up a bound that is an integer because of the floating point errors
+    return max(bound, int(math.ceil(lpLowerBound(params["demand"], placements) - 1e-6)))
+
+
+def reachesLowerBound(nurses, params, lowerBound):
+    """
+    Checks if a solution covers all the demand with a number of nurses that is not greater than a lower bound, so it is
+    optimal
+    :param nurses: A matrix or a NurseSchedule. The cell (i, j) is 1 if nurse "i" works at time "j"
+    :param params: Params of an instance of the problem
+    :param lowerBound: Lower bound of the number of nurses
+    :return: True if the solution is optimal
+    """
+    (matrix, counts) = toRows(nurses, len(params["demand"]))
+    cost = counts[matrix.any(axis=1)].sum()
+    return cost <= lowerBound and bool((counts @ matrix.astype(np.int64) >= np.asarray(params["demand"])).all())
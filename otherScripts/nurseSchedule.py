@@ -0,0 +1,189 @@
+import numpy as np
+
+# Number of ones of every byte
+_popcountTable = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks):
+    """
+    Counts the number of ones of every bitmask
+    :param masks: A numpy array of uint64
+    :return: A numpy array with the same shape and the number of ones of each bitmask
+    """
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return _popcountTable[masks.view(np.uint8)].reshape(masks.shape + (8,)).sum(axis=-1, dtype=int)
+
+
+def matrixToMasks(matrix):
+    """
+    Converts working days to bitmasks
+    :param matrix: An array (..., hoursDay). The last axis is 1 at the hours the nurse works
+    :return: An array (...) of uint64. The bit h of a bitmask is 1 if the nurse works at the hour h
+    """
+    matrix = np.asarray(matrix, dtype=np.uint64)
+    return (matrix << np.arange(matrix.shape[-1], dtype=np.uint64)).sum(axis=-1, dtype=np.uint64)
+
+
+def masksToMatrix(masks, hoursDay):
+    """
+    Converts bitmasks to working days
+    :param masks: An array (...) of bitmasks
+    :param hoursDay: Number of hours in a day
+    :return: An array (..., hoursDay) of uint8. The cell h is 1 if the nurse works at the hour h
+    """
+    masks = np.asarray(masks, dtype=np.uint64)
+    return ((masks[..., None] >> np.arange(hoursDay, dtype=np.uint64)) & np.uint64(1)).astype(np.uint8)
+
+
+def _getLastBits(masks):
+    """
+    :param masks: An array of uint64
+    :return: The position of the highest bit set of each bitmask (-1 if it's 0)
+    """
+    smeared = masks.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        smeared |= smeared >> np.uint64(shift)
+    return popcount(smeared) - 1
+
+
+def _getFirstBits(masks):
+    """
+    :param masks: An array of uint64
+    :return: The position of the lowest bit set of each bitmask (meaningless if it's 0)
+    """
+    lowest = masks & (~masks + np.uint64(1))
+    return popcount(lowest - np.uint64(1))
+
+
+def _getMaxRun(masks):
+    """
+    :param masks: An array of uint64
+    :return: The length of the longest group of consecutive ones of each bitmask
+    """
+    maxRun = np.zeros(masks.shape, dtype=int)
+    masks = masks.copy()
+    while masks.any():
+        maxRun += masks != 0
+        masks &= masks >> np.uint64(1)
+    return maxRun
+
+
+class NurseSchedule:
+    """
+    Working days of a set of nurses. Each row is a bitmask where the bit h is 1 if the nurse works at the hour h, so a
+    day of up to 63 hours fits in a machine word, and the number of nurses that have this working day. The methods that
+    give a value per nurse give it for each row
+    """
+    def __init__(self, masks, hoursDay, counts=None):
+        """
+        :param masks: Iterable with the bitmask of each row
+        :param hoursDay: Number of hours in a day
+        :param counts: Iterable with the number of nurses of each row. By default, one nurse per row
+        """
+        assert hoursDay < 64
+        self.masks = np.array(masks, dtype=np.uint64).reshape(-1)
+        self.hoursDay = hoursDay
+        if counts is None:
+            self.counts = np.ones(len(self.masks), dtype=np.int64)
+        else:
+            self.counts = np.array(counts, dtype=np.int64).reshape(-1)
+
+    @classmethod
+    def fromCounts(cls, countsByMask, hoursDay):
+        """
+        :param countsByMask: Dictionary with the number of nurses of each working day, given as a bitmask
+        :param hoursDay: Number of hours in a day
+        :return: The NurseSchedule with one row per working day
+        """
+        return cls(list(countsByMask.keys()), hoursDay, list(countsByMask.values()))
+
+    @classmethod
+    def fromMatrix(cls, nurses, hoursDay=None):
+        """
+        :param nurses: A matrix. The cell (i, j) is 1 if nurse "i" works at time "j"
+        :param hoursDay: Number of hours in a day. Only needed when there are no nurses
+        :return: The NurseSchedule of the nurses
+        """
+        matrix = np.asarray(nurses, dtype=np.uint8)
+        if matrix.size == 0:
+            return cls([], 0 if hoursDay is None else hoursDay)
+        return cls(matrixToMasks(matrix), matrix.shape[1])
+
+    def compress(self):
+        """
+        :return: An equivalent NurseSchedule with one row per distinct working day. The rows without nurses are removed
+        """
+        (masks, inverse) = np.unique(self.masks, return_inverse=True)
+        counts = np.bincount(inverse.reshape(-1), weights=self.counts, minlength=len(masks)).astype(np.int64)
+        return NurseSchedule(masks[counts > 0], self.hoursDay, counts[counts > 0])
+
+    def getRows(self):
+        """
+        :return: A matrix (uint8) with the working day of each row and a vector with the number of nurses of each row
+        """
+        return masksToMatrix(self.masks, self.hoursDay), self.counts
+
+    def toMatrix(self):
+        """
+        :return: A matrix (uint8). The cell (i, j) is 1 if nurse "i" works at time "j"
+        """
+        return np.repeat(masksToMatrix(self.masks, self.hoursDay), self.counts, axis=0)
+
+    def toList(self):
+        """
+        :return: A list of lists. The element (i, j) is 1 if nurse "i" works at time "j"
+        """
+        return self.toMatrix().tolist()
+
+    def getHours(self):
+        """
+        :return: The number of hours each nurse works
+        """
+        return popcount(self.masks)
+
+    def getOffer(self):
+        """
+        :return: The number of nurses that work at each hour
+        """
+        return self.counts @ masksToMatrix(self.masks, self.hoursDay).astype(np.int64)
+
+    def getNumWorkingNurses(self):
+        """
+        :return: The number of nurses that work at least one hour
+        """
+        return int(self.counts[self.masks != 0].sum())
+
+    def getPresenceHours(self):
+        """
+        :return: The number of hours each nurse spends at the hospital
+        """
+        return np.where(self.masks != 0, _getLastBits(self.masks) - _getFirstBits(self.masks) + 1, 0)
+
+    def getConsecHours(self):
+        """
+        :return: The maximum number of consecutive hours each nurse works
+        """
+        return _getMaxRun(self.masks)
+
+    def getRestingHours(self):
+        """
+        :return: The maximum number of consecutive resting hours of each nurse between her first and her last
+        working hour
+        """
+        first = np.where(self.masks != 0, _getFirstBits(self.masks), 0).astype(np.uint64)
+        last = _getLastBits(self.masks).astype(np.uint64) + np.uint64(1)
+        presence = (np.uint64(1) << last) - (np.uint64(1) << first)
+        presence[self.masks == 0] = 0
+        return _getMaxRun(presence & ~self.masks)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def __str__(self):
+        return "\n".join("\n".join([str(row)] * count)
+                         for (row, count) in zip(masksToMatrix(self.masks, self.hoursDay).tolist(), self.counts)
+                         if count > 0)
+
+    def __repr__(self):
+        return "NurseSchedule(" + str(self.masks.tolist()) + ", " + str(self.hoursDay) + ", " + \
+               str(self.counts.tolist()) + ")"
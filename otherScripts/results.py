@@ -0,0 +1,115 @@
+import os
+import json
+import math
+import numpy as np
+from otherScripts.nurseSchedule import NurseSchedule
+
+
+def encodeSchedule(nurses):
+    """
+    Compact encoding of a solution: the bitmask of each distinct working day and the number of nurses that have it
+    :param nurses: A NurseSchedule
+    :return: A dictionary that can be written as JSON, or None if there is no solution
+    """
+    if not isinstance(nurses, NurseSchedule) or len(nurses) == 0:
+        return None
+    nurses = nurses.compress()
+    return {"hoursDay": nurses.hoursDay, "masks": nurses.masks.tolist(), "counts": nurses.counts.tolist()}
+
+
+def toJson(value):
+    """
+    Converts the infinite numbers of a value to None and the numpy scalars to Python numbers, so it can be written as
+    standard JSON
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isinf(value):
+        return None
+    if isinstance(value, dict):
+        return {key: toJson(elem) for (key, elem) in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [toJson(elem) for elem in value]
+    return value
+
+
+def _dropIncompleteLine(fileName):
+    """
+    Removes the incomplete last line of a JSON Lines file of an interrupted execution, so the new records don't
+    continue it
+    """
+    if not os.path.exists(fileName):
+        return
+    with open(fileName, 'r+b') as f:
+        data = f.read()
+        if len(data) > 0 and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class ResultWriter:
+    """
+    Writes one JSON record per line. Each record is written with a single write call and synced to disk, so a file
+    of an interrupted execution has all the complete records and, at most, an incomplete last line
+    """
+    def __init__(self, fileName, append=False):
+        """
+        :param fileName: JSON Lines file
+        :param append: If the records are appended to the existing ones (an incomplete last line is removed).
+        Otherwise, the file is truncated
+        """
+        if append:
+            _dropIncompleteLine(fileName)
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        self.fd = os.open(fileName, flags, 0o644)
+
+    def write(self, record):
+        """
+        :param record: Dictionary with the record
+        """
+        line = json.dumps(toJson(record), separators=(",", ":")) + "\n"
+        os.write(self.fd, line.encode())
+        os.fsync(self.fd)
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def readResults(fileName):
+    """
+    Reads the records of a JSON Lines file. The incomplete lines of an interrupted execution are skipped
+    :param fileName: JSON Lines file
+    :return: A list with the records
+    """
+    records = []
+    if not os.path.exists(fileName):
+        return records
+    with open(fileName, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def getSolvedInstances(records, solverName, solverParams, maxTime):
+    """
+    Gets the instances that already have a result of a solver with the same params and time limit. The instances whose
+    worker crashed (status "error") are not considered solved
+    :param records: Records given by readResults
+    :param solverName: Name of the solver
+    :param solverParams: Params of the solver
+    :param maxTime: Time limit of the solver
+    :return: A set with the pairs (name, key given by instance.getInstanceKey) of the instances
+    """
+    (solverParams, maxTime) = toJson([solverParams, maxTime])
+    return set((record["instance"], record["instanceKey"]) for record in records
+               if "instanceKey" in record and record.get("solver") == solverName and
+               record.get("solverParams") == solverParams and record.get("maxTime") == maxTime and
+               record.get("status", "ok") != "error")
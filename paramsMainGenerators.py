@@ -16,3 +16,17 @@ distrDemand = (int(rnd.gauss(20*(i/hoursDay)+100, 5)) for i in ittl.count())
 
 # Random generator parameters
 distrMinHours = (int(rnd.gauss(4, 1)) for _ in ittl.count())
+
+# Batch generator parameters. (mean, standard deviation) of the normal distributions of the constraints and (mean at
+# the first hour, increase of the mean until the last hour, standard deviation) of the demand
+batchDistr = {'maxHours': (10, 1), 'maxConsec': (6, 1), 'maxPresence': (12, 1), 'demand': (100, 20, 5)}
+batchNThreads = 4
+batchChunkSize = 100
+
+# Stress families parameters. Number of nurses of the smallest and largest instances and number of sizes between them
+# (geometric), proportions of the offer of the known solution that are demanded and constraints of each tightness level
+stressSizes = (100, 10000, 5)
+stressDemandLevels = [1.0, 0.9, 0.75]
+stressTightness = {'loose': {'minHours': 2, 'maxHours': 12, 'maxConsec': 6, 'maxPresence': 16},
+                   'medium': {'minHours': 4, 'maxHours': 10, 'maxConsec': 5, 'maxPresence': 12},
+                   'tight': {'minHours': 6, 'maxHours': 8, 'maxConsec': 3, 'maxPresence': 10}}
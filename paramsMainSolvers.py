@@ -5,11 +5,28 @@ oplParams = {'pathToOPL': '"C:\Program Files\IBM\ILOG\CPLEX_Studio1271\opl\\bin\
 graspParams = {'numIter': 50,
                'alfa': 0.1,
                'nThreads': 8,
-               'maxItWithoutImpr': 40}
+               'maxItWithoutImpr': 40,
+               'elitePoolSize': 0,
+               'checkpointFolder': None,
+               'checkpointInterval': 5}
 
 brkgaParams = {'numIndividuals': 200,
                'maxGenerations': 150,
                'eliteProp': 0.1,
                'mutantsProp': 0.2,
                'inheritanceProb': 0.7,
-               'maxItWithoutImpr': 50}
\ No newline at end of file
+               'maxItWithoutImpr': 50,
+               'nThreads': 1,
+               'nIslands': 1,
+               'migrationInterval': 10,
+               'numMigrants': 2,
+               'topology': 'ring',
+               'warmStart': 0,
+               'checkpointFolder': None,
+               'checkpointInterval': 5}
+
+# Batch mode (-p): number of instances solved at the same time, seconds a worker can exceed the time limit before it's
+# killed and maximum memory of each worker in MB (None for no limit)
+batchParams = {'nWorkers': 1,
+               'timeMargin': 60,
+               'maxMemory': None}